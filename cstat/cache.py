@@ -0,0 +1,134 @@
+# vi: set encoding=utf-8
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+import os
+import re
+import json
+import zlib
+import appdirs
+from datetime import datetime, timezone
+from typing import NamedTuple
+from .connector import record_class
+from .log import get_logger
+
+logger = get_logger(__name__)
+
+RE_UNSAFE = re.compile(r'[^\w.-]+')
+
+
+class Snapshot(NamedTuple):
+    timestamp: float
+    state: dict
+
+
+def cache_path(key, suffix):
+    cache_dir = appdirs.user_cache_dir('cstat', 'chaudum')
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    return os.path.join(cache_dir, RE_UNSAFE.sub('_', key) + suffix)
+
+
+def cache_file(args, suffix):
+    """
+    Return the path of a per cluster file in the user cache directory.
+    """
+    return cache_path('{0}_{1}'.format(args.host, args.port), suffix)
+
+
+def snapshot_file(args):
+    if getattr(args, 'attach', None):
+        # the cluster of an attached client is only known to the collector,
+        # so its snapshot is kept per socket
+        return cache_path(os.path.abspath(args.attach), '.snapshot')
+    return cache_file(args, '.snapshot')
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return {'$ts': value.timestamp()}
+    raise TypeError('{0!r} is not JSON serializable'.format(value))
+
+
+def _object_hook(obj):
+    if len(obj) == 1 and '$ts' in obj:
+        return datetime.fromtimestamp(obj['$ts'], tz=timezone.utc)
+    return obj
+
+
+def encode_state(state):
+    """
+    Encode a query result state (``{name: [Record, ...]}``) as JSON bytes.
+    """
+    data = {}
+    for name, records in state.items():
+        if records:
+            data[name] = {
+                'cols': list(records[0]._fields),
+                'rows': [list(r) for r in records],
+            }
+        else:
+            data[name] = records
+    return json.dumps(data, default=_default,
+                      separators=(',', ':')).encode('utf-8')
+
+
+def decode_state(raw):
+    state = {}
+    for name, value in json.loads(raw.decode('utf-8'),
+                                  object_hook=_object_hook).items():
+        if isinstance(value, dict):
+            Record = record_class(tuple(value['cols']))
+            state[name] = [Record(*r) for r in value['rows']]
+        else:
+            state[name] = value
+    return state
+
+
+def load_snapshot(args):
+    """
+    Load the last persisted snapshot of the cluster, or ``None`` if there is
+    no (readable) snapshot.
+    """
+    fn = snapshot_file(args)
+    try:
+        with open(fn, 'rb') as fp:
+            timestamp = os.fstat(fp.fileno()).st_mtime
+            state = decode_state(zlib.decompress(fp.read()))
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning('could not load snapshot %s: %s', fn, e)
+        return None
+    return Snapshot(timestamp, state)
+
+
+def save_snapshot(args, state):
+    if not state:
+        return
+    fn = snapshot_file(args)
+    tmp = '{0}.{1}.tmp'.format(fn, os.getpid())
+    try:
+        with open(tmp, 'wb') as fp:
+            fp.write(zlib.compress(encode_state(state)))
+        os.replace(tmp, fn)
+    except Exception as e:
+        logger.warning('could not save snapshot %s: %s', fn, e)
+    else:
+        logger.debug('saved snapshot %s', fn)
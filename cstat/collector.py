@@ -0,0 +1,211 @@
+# vi: set encoding=utf-8
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+
+import os
+import json
+import struct
+import asyncio
+from .cache import cache_file, encode_state, decode_state
+from .connector import FULL_PLAN, DataProvider, QueryFailure, pool
+from .log import get_logger
+
+logger = get_logger(__name__)
+
+HEADER = struct.Struct('!cI')
+RESULT, FAILURE = b'R', b'F'
+
+# clients that do not read fast enough are disconnected instead of buffering
+# snapshots for them without bound
+MAX_CLIENT_BUFFER = 16 * 1024 * 1024
+
+
+def socket_file(args):
+    return args.socket or cache_file(args, '.sock')
+
+
+def frame(kind, payload):
+    return HEADER.pack(kind, len(payload)) + payload
+
+
+def encode_failure(failure):
+    return json.dumps({
+        'name': failure.name,
+        'error': str(failure.error),
+        'last_success': failure.last_success,
+    }).encode('utf-8')
+
+
+def decode_failure(payload):
+    data = json.loads(payload.decode('utf-8'))
+    return QueryFailure(data['name'], Exception(data['error']),
+                        data['last_success'])
+
+
+class Collector:
+    """
+    Polls the cluster with a single ``DataProvider`` and publishes every
+    result to all UI clients connected to a Unix socket.
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.path = socket_file(args)
+        self.clients = set()
+        self.provider = None
+        self.server = None
+        # node ids of the last node and attributes results
+        self.members = None
+        self.attributed = None
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.server = await asyncio.start_unix_server(self.on_client, self.path)
+        os.chmod(self.path, 0o600)
+        try:
+            conn = await pool(self.args)
+        except Exception as e:
+            logger.warning('could not connect: %s', e)
+            conn = None
+        self.provider = DataProvider(conn, self,
+                                     interval=self.args.interval,
+                                     timeout=self.args.timeout,
+                                     connect=lambda: pool(self.args),
+                                     planner=self.plan)
+
+    def plan(self):
+        """
+        Query everything that attached clients may display. Node attributes
+        are only queried when the set of nodes changed.
+        """
+        return FULL_PLAN._replace(attributes=self.attributed is None or
+                                  self.members != self.attributed)
+
+    def close(self):
+        for writer in list(self.clients):
+            writer.close()
+        if self.server is not None:
+            self.server.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    async def on_client(self, reader, writer):
+        logger.info('client connected')
+        if self.provider is not None and self.provider.state:
+            writer.write(frame(RESULT, encode_state(self.provider.state)))
+        self.clients.add(writer)
+        try:
+            # clients never send anything, reading only detects disconnects
+            await reader.read()
+        finally:
+            self.clients.discard(writer)
+            writer.close()
+            logger.info('client disconnected')
+
+    def apply(self, result=None, failure=None):
+        if result is not None:
+            if result.get('nodes') is not None:
+                self.members = frozenset(r.id for r in result['nodes'])
+            if result.get('attributes') is not None:
+                self.attributed = frozenset(r.id for r in result['attributes'])
+            self.broadcast(frame(RESULT, encode_state(result)))
+        if isinstance(failure, QueryFailure):
+            self.broadcast(frame(FAILURE, encode_failure(failure)))
+        elif failure is not None:
+            logger.error('collector failed: %s', failure)
+
+    def broadcast(self, data):
+        for writer in list(self.clients):
+            if writer.transport.get_write_buffer_size() > MAX_CLIENT_BUFFER:
+                logger.warning('dropping slow client')
+                self.clients.discard(writer)
+                writer.close()
+                continue
+            writer.write(data)
+
+
+def run_collector(args):
+    loop = asyncio.get_event_loop()
+    collector = Collector(args)
+    loop.run_until_complete(collector.start())
+    print('Collecting from {0}:{1}, publishing on {2}'.format(
+        args.host, args.port, collector.path))
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        collector.close()
+    return 0
+
+
+class RemoteProvider:
+    """
+    Receives results from a collector instead of querying the cluster. It
+    provides the same interface to the UI as ``DataProvider``.
+    """
+
+    BACKOFF_MIN = DataProvider.BACKOFF_MIN
+    BACKOFF_MAX = DataProvider.BACKOFF_MAX
+
+    def __init__(self, path, consumer):
+        self.path = path
+        self.consumer = consumer
+        self.pool = None
+        self.state = {}
+        self.attempt = 0
+        asyncio.ensure_future(self.run())
+
+    async def run(self):
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.path)
+            except OSError as e:
+                self.consumer.apply(failure=QueryFailure(
+                    'collector', e, None))
+            else:
+                self.attempt = 0
+                try:
+                    await self.receive(reader)
+                except (OSError, asyncio.IncompleteReadError) as e:
+                    logger.warning('lost connection to collector: %s', e)
+                finally:
+                    writer.close()
+            delay = min(self.BACKOFF_MAX, self.BACKOFF_MIN * 2 ** self.attempt)
+            self.attempt += 1
+            await asyncio.sleep(delay)
+
+    async def receive(self, reader):
+        while True:
+            kind, size = HEADER.unpack(await reader.readexactly(HEADER.size))
+            payload = await reader.readexactly(size)
+            if kind == RESULT:
+                state = decode_state(payload)
+                self.consumer.apply(state)
+                self.state.update(state)
+            elif kind == FAILURE:
+                self.consumer.apply(failure=decode_failure(payload))
+
+    def refresh(self):
+        pass
+
+    def __getitem__(self, key):
+        return self.state.get(key)
@@ -25,7 +25,15 @@ import asyncio
 import traceback
 from distutils.version import StrictVersion
 from urwid.raw_display import Screen
-from .connector import DataProvider, pool, toggle_stats
+from .connector import DataProvider, QueryFailure, pool, toggle_stats
+from .cache import load_snapshot, save_snapshot
+from .config import load_config
+from .rules import RuleEngine
+from .export import Exporter
+from .collector import RemoteProvider
+from .groups import GroupIndex
+from .panels import PanelScheduler, load_panels
+from .snapshot import NodeSnapshot
 from .window import MainWindow
 from .log import get_logger
 
@@ -47,6 +55,7 @@ PALETTE = [
     ('tx', 'dark cyan', 'default'),
     ('rx', 'dark magenta', 'default'),
     ('head', 'black, bold', 'dark cyan'),
+    ('stale', 'dark gray', 'default'),
 ]
 
 
@@ -71,27 +80,99 @@ class CrateStat:
         self.loop = None
         self.exit_message = None
         self.view = None
+        self.provider = None
+        self.config = load_config(args.config)
+        self.rules = RuleEngine.from_config(self.config)
+        self.panels = load_panels(self.config)
+        self.scheduler = None
+        self.exporter = None
+        if args.export:
+            self.exporter = Exporter(args.export, fmt=args.export_format)
 
     def serve(self, aioloop):
         screen = Screen()
         screen.set_terminal_properties(256)
-        self.view = MainWindow(self)
+        groups = None
+        if self._args.group_by or self._args.group_regex:
+            groups = GroupIndex(attribute=self._args.group_by,
+                                pattern=self._args.group_regex)
+        self.view = MainWindow(self, deviation=self._args.deviation,
+                               groups=groups, panels=self.panels,
+                               history_bytes=int(self._args.history_size *
+                                                 1024 * 1024))
         self.loop = urwid.MainLoop(self.view, PALETTE,
                                    screen=screen,
                                    event_loop=urwid.AsyncioEventLoop(loop=aioloop),
                                    unhandled_input=self.on_input)
-        task = asyncio.ensure_future(pool(self._args))
-        task.add_done_callback(self.on_connect)
-        self.loop.run()
+        if self._args.attach:
+            if self.panels:
+                logger.info('panels are not queried by attached clients')
+            self.provider = RemoteProvider(self._args.attach,
+                                           ResultConsumer(on_result=self.on_data,
+                                                          on_failure=self.on_error))
+        else:
+            task = asyncio.ensure_future(pool(self._args))
+            task.add_done_callback(self.on_connect)
+        self.restore()
+        try:
+            self.loop.run()
+        finally:
+            self.view.history.close()
+            if self.exporter is not None:
+                self.exporter.close()
+            if self.provider is not None:
+                save_snapshot(self._args, self.provider.state)
+
+    def restore(self):
+        snapshot = load_snapshot(self._args)
+        if snapshot is None:
+            return
+        logger.debug('restore snapshot from %s', snapshot.timestamp)
+        try:
+            self.view.update(stale=True, **snapshot.state)
+        except Exception as e:
+            # snapshots written by other cstat versions may lack columns
+            logger.warning('could not restore snapshot: %s', e)
+        else:
+            self.view.set_stale(snapshot.timestamp)
 
     def on_connect(self, t):
-        self.pool = t.result()
+        try:
+            self.pool = t.result()
+        except Exception as e:
+            # the provider keeps reconnecting with backoff
+            logger.warning('could not connect: %s', e)
+        else:
+            logger.debug('connected to %s', self.pool)
         consumer = ResultConsumer(on_result=self.on_data,
                                   on_failure=self.on_error)
         self.provider = DataProvider(self.pool,
                                      consumer,
-                                     interval=self._args.interval)
-        logger.debug('connected to %s', self.pool)
+                                     interval=self._args.interval,
+                                     timeout=self._args.timeout,
+                                     connect=lambda: pool(self._args),
+                                     planner=self.plan)
+        if self.panels:
+            self.scheduler = PanelScheduler(
+                self.panels, self.provider,
+                ResultConsumer(on_result=self.view.update_panel,
+                               on_failure=self.on_error),
+                visible=lambda panel: self.view.panels_visible(),
+                timeout=self._args.timeout)
+            self.scheduler.refresh()
+
+    def plan(self):
+        return self.view.plan(
+            needs_nodes=len(self.rules) > 0 or self.exporter is not None,
+            needs_jobs=self.exporter is not None)
+
+    def on_view_change(self):
+        if self.provider is not None:
+            self.provider.refresh()
+
+    def on_panels_change(self):
+        if self.scheduler is not None:
+            self.scheduler.refresh()
 
     def quit(self, msg=None):
         logger.info('quit: %s', msg)
@@ -101,14 +182,58 @@ class CrateStat:
         logger.debug('handle input: %s', key)
         if key in ('q', 'Q'):
             self.quit('Bye!')
-        elif key == 'f3':
-            current_value = self.provider['settings'][0].stats_enabled
-            toggle_stats(current_value, self.pool, self.on_data)
+        elif key == 'f3' and self.provider is not None:
+            # clients attached to a collector have no connection of their own
+            settings = self.provider.pool is not None and self.provider['settings']
+            if settings:
+                toggle_stats(settings[0].stats_enabled,
+                             self.provider.pool, self.on_data)
         else:
             self.view.handle_input(key)
 
     def on_data(self, data):
         self.view.update(**data)
+        nodes = None
+        if data.get('nodes') and (len(self.rules) or self.exporter is not None):
+            # the view does not process results while it is paused or
+            # replaying the history after a pause
+            live = self.view.frozen is None and self.view.resuming is None
+            nodes = live and self.view.nodes or NodeSnapshot(data['nodes'])
+        if nodes is not None and len(self.rules):
+            self.check_rules(nodes)
+        if self.exporter is not None:
+            if nodes is not None:
+                self.exporter.add_nodes(nodes)
+            self.exporter.add_jobs(data.get('jobs'))
+
+    def check_rules(self, nodes):
+        for alert in self.rules.evaluate(nodes):
+            rule = self.rules.rule(alert.rule)
+            if rule.bell:
+                sys.stdout.write('\a')
+                sys.stdout.flush()
+            if rule.command:
+                asyncio.ensure_future(self.run_hook(rule.command, alert))
+        self.view.set_alerts(self.rules.alerts())
+
+    async def run_hook(self, command, alert):
+        env = dict(os.environ,
+                   CSTAT_RULE=alert.rule,
+                   CSTAT_NODE=alert.node,
+                   CSTAT_VALUE=str(alert.value))
+        try:
+            proc = await asyncio.create_subprocess_shell(
+                command, env=env,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.DEVNULL)
+            code = await proc.wait()
+        except Exception as e:
+            logger.warning('alert hook of %s failed: %s', alert.rule, e)
+        else:
+            logger.info('alert hook of %s exited with %s', alert.rule, code)
 
     def on_error(self, failure):
-        self.quit(msg=str(failure))
+        if isinstance(failure, QueryFailure):
+            self.view.set_failure(failure)
+        else:
+            self.quit(msg=str(failure))
@@ -0,0 +1,70 @@
+# vi: set encoding=utf-8
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+
+import os
+import re
+import appdirs
+import configparser
+
+RE_DURATION = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*(ms|s|m|h)?\s*$')
+DURATION_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600, None: 1}
+
+
+def config_file():
+    return os.path.join(appdirs.user_config_dir('cstat', 'chaudum'), 'cstat.ini')
+
+
+def load_config(fn=None):
+    """
+    Load the ini style configuration file. A missing default configuration
+    file results in an empty configuration.
+    """
+    config = configparser.ConfigParser(interpolation=None)
+    if fn is None:
+        fn = config_file()
+        if not os.path.exists(fn):
+            return config
+    try:
+        with open(fn, 'r', encoding='utf-8') as fp:
+            config.read_file(fp)
+    except (OSError, configparser.Error) as e:
+        raise ValueError(f'could not read {fn}: {e}')
+    return config
+
+
+def sections(config, kind):
+    """
+    Yield ``(name, section)`` for all sections named ``[<kind>:<name>]``.
+    """
+    prefix = kind + ':'
+    for section in config.sections():
+        if section.startswith(prefix):
+            yield section[len(prefix):].strip(), config[section]
+
+
+def parse_duration(value):
+    """
+    Parse a duration such as ``30s``, ``5m`` or ``1.5`` into seconds.
+    """
+    match = RE_DURATION.match(str(value))
+    if match is None:
+        raise ValueError(f'invalid duration: {value}')
+    return float(match.group(1)) * DURATION_UNITS[match.group(2)]
@@ -21,7 +21,7 @@
 
 import re
 import json
-import aiopg
+import time
 import asyncio
 import functools
 from collections import namedtuple
@@ -38,8 +38,31 @@ class NamedQuery(NamedTuple):
     args: list
 
 
+class QueryFailure(NamedTuple):
+    name: str
+    error: Exception
+    last_success: float
+
+
+class Plan(NamedTuple):
+    jobs: bool
+    nodes: bool
+    attributes: bool = False
+    tables: bool = False
+
+
+FULL_PLAN = Plan(jobs=True, nodes=True, tables=True)
+
+
+class QueryTimeout(Exception):
+
+    def __init__(self, name, timeout):
+        super().__init__(f'{name} query timed out after {timeout:.1f}s')
+
+
 CRATE_2_0 = StrictVersion('2.0')
 CRATE_2_3 = StrictVersion('2.3')
+CRATE_4_0 = StrictVersion('4.0')
 
 NODE_QUERY_V_2_0 = NamedQuery('nodes', '''
 SELECT id,
@@ -54,9 +77,20 @@ SELECT id,
        load,
        heap,
        mem,
-       fs,
+       fs['total'] as fs_total,
+       fs['data']['dev'] as fs_data_dev,
+       fs['disks']['dev'] as disk_dev,
+       fs['disks']['size'] as disk_size,
+       fs['disks']['used'] as disk_used,
+       fs['disks']['reads'] as disk_reads,
+       fs['disks']['writes'] as disk_writes,
+       fs['disks']['bytes_read'] as disk_bytes_read,
+       fs['disks']['bytes_written'] as disk_bytes_written,
        network['probe_timestamp'] as net_timestamp,
-       network['tcp']['packets'] as net_packets
+       network['tcp']['packets'] as net_packets,
+       thread_pools['name'] as pool_names,
+       thread_pools['rejected'] as pool_rejected,
+       thread_pools['completed'] as pool_completed
 FROM sys.nodes
 ORDER BY name
 ''', None)
@@ -74,13 +108,112 @@ SELECT id,
        load,
        heap,
        mem,
-       fs,
+       fs['total'] as fs_total,
+       fs['data']['dev'] as fs_data_dev,
+       fs['disks']['dev'] as disk_dev,
+       fs['disks']['size'] as disk_size,
+       fs['disks']['used'] as disk_used,
+       fs['disks']['reads'] as disk_reads,
+       fs['disks']['writes'] as disk_writes,
+       fs['disks']['bytes_read'] as disk_bytes_read,
+       fs['disks']['bytes_written'] as disk_bytes_written,
        network['probe_timestamp'] as net_timestamp,
-       network['tcp']['packets'] as net_packets
+       network['tcp']['packets'] as net_packets,
+       thread_pools['name'] as pool_names,
+       thread_pools['rejected'] as pool_rejected,
+       thread_pools['completed'] as pool_completed
+FROM sys.nodes
+ORDER BY name
+''', None)
+
+# the per node columns needed to detect node events and to feed the heap
+# history and the disk forecasts, queried along with the summary query
+NODE_VITALS_QUERY = NamedQuery('vitals', '''
+SELECT id,
+       name,
+       os['timestamp'] AS hosttime,
+       heap,
+       fs['total']['used'] AS fs_used,
+       fs['total']['size'] AS fs_size,
+       thread_pools['completed'] AS pool_completed
 FROM sys.nodes
 ORDER BY name
 ''', None)
 
+NODE_SUMMARY_QUERY_V_2_0 = NamedQuery('summary', '''
+SELECT count(*) AS num,
+       sum(os['cpu']['system'] + os['cpu']['user'] + os['cpu']['stolen']) AS cpu_used,
+       sum(process['cpu']['percent']) AS process,
+       sum(heap['used']) AS heap_used,
+       sum(heap['max']) AS heap_max,
+       sum(mem['used']) AS mem_used,
+       sum(mem['used'] + mem['free']) AS mem_total,
+       sum(fs['total']['used']) AS fs_used,
+       sum(fs['total']['size']) AS fs_size,
+       sum(fs['total']['bytes_read']) AS fs_read,
+       sum(fs['total']['bytes_written']) AS fs_written,
+       max(os['timestamp']) AS hosttime,
+       max(network['probe_timestamp']) AS net_timestamp,
+       sum(network['tcp']['packets']['sent']) AS net_tx,
+       sum(network['tcp']['packets']['received']) AS net_rx,
+       avg(load['1']) AS load1,
+       avg(load['5']) AS load5,
+       avg(load['15']) AS load15,
+       min(os['cpu']['system'] + os['cpu']['user'] + os['cpu']['stolen']) / 100.0 AS cpu_lo,
+       percentile((os['cpu']['system'] + os['cpu']['user'] + os['cpu']['stolen']) / 100.0, [0.5, 0.9]) AS cpu_perc,
+       max(os['cpu']['system'] + os['cpu']['user'] + os['cpu']['stolen']) / 100.0 AS cpu_hi,
+       min(process['cpu']['percent']) / 100.0 AS process_lo,
+       percentile(process['cpu']['percent'] / 100.0, [0.5, 0.9]) AS process_perc,
+       max(process['cpu']['percent']) / 100.0 AS process_hi,
+       min(heap['used'] / CAST(heap['max'] AS double)) AS heap_lo,
+       percentile(heap['used'] / CAST(heap['max'] AS double), [0.5, 0.9]) AS heap_perc,
+       max(heap['used'] / CAST(heap['max'] AS double)) AS heap_hi,
+       min(mem['used'] / CAST(mem['used'] + mem['free'] AS double)) AS mem_lo,
+       percentile(mem['used'] / CAST(mem['used'] + mem['free'] AS double), [0.5, 0.9]) AS mem_perc,
+       max(mem['used'] / CAST(mem['used'] + mem['free'] AS double)) AS mem_hi,
+       min(fs['total']['used'] / CAST(fs['total']['size'] AS double)) AS disk_lo,
+       percentile(fs['total']['used'] / CAST(fs['total']['size'] AS double), [0.5, 0.9]) AS disk_perc,
+       max(fs['total']['used'] / CAST(fs['total']['size'] AS double)) AS disk_hi
+FROM sys.nodes
+''', None)
+
+NODE_SUMMARY_QUERY_V_2_3 = NamedQuery('summary', '''
+SELECT count(*) AS num,
+       sum(os['cpu']['used']) AS cpu_used,
+       sum(process['cpu']['percent']) AS process,
+       sum(heap['used']) AS heap_used,
+       sum(heap['max']) AS heap_max,
+       sum(mem['used']) AS mem_used,
+       sum(mem['used'] + mem['free']) AS mem_total,
+       sum(fs['total']['used']) AS fs_used,
+       sum(fs['total']['size']) AS fs_size,
+       sum(fs['total']['bytes_read']) AS fs_read,
+       sum(fs['total']['bytes_written']) AS fs_written,
+       max(os['timestamp']) AS hosttime,
+       max(network['probe_timestamp']) AS net_timestamp,
+       sum(network['tcp']['packets']['sent']) AS net_tx,
+       sum(network['tcp']['packets']['received']) AS net_rx,
+       avg(load['1']) AS load1,
+       avg(load['5']) AS load5,
+       avg(load['15']) AS load15,
+       min(os['cpu']['used']) / 100.0 AS cpu_lo,
+       percentile((os['cpu']['used']) / 100.0, [0.5, 0.9]) AS cpu_perc,
+       max(os['cpu']['used']) / 100.0 AS cpu_hi,
+       min(process['cpu']['percent']) / 100.0 AS process_lo,
+       percentile(process['cpu']['percent'] / 100.0, [0.5, 0.9]) AS process_perc,
+       max(process['cpu']['percent']) / 100.0 AS process_hi,
+       min(heap['used'] / CAST(heap['max'] AS double)) AS heap_lo,
+       percentile(heap['used'] / CAST(heap['max'] AS double), [0.5, 0.9]) AS heap_perc,
+       max(heap['used'] / CAST(heap['max'] AS double)) AS heap_hi,
+       min(mem['used'] / CAST(mem['used'] + mem['free'] AS double)) AS mem_lo,
+       percentile(mem['used'] / CAST(mem['used'] + mem['free'] AS double), [0.5, 0.9]) AS mem_perc,
+       max(mem['used'] / CAST(mem['used'] + mem['free'] AS double)) AS mem_hi,
+       min(fs['total']['used'] / CAST(fs['total']['size'] AS double)) AS disk_lo,
+       percentile(fs['total']['used'] / CAST(fs['total']['size'] AS double), [0.5, 0.9]) AS disk_perc,
+       max(fs['total']['used'] / CAST(fs['total']['size'] AS double)) AS disk_hi
+FROM sys.nodes
+''', None)
+
 JOBS_QUERY = NamedQuery('jobs', '''
 SELECT upper(regexp_matches(stmt, '^\s*(\w+).*')[1]) AS stmt,
        min(ended - started) AS "min",
@@ -97,6 +230,23 @@ GROUP BY 1
 ORDER BY count DESC
 ''', None)
 
+# latency histogram with four buckets per power of two (see
+# stats.BUCKETS_PER_OCTAVE) per user and coordinating node, which is pivoted
+# on the client; sys.jobs_log has the node column since CrateDB 4.0
+JOB_BUCKETS_QUERY = NamedQuery('job_buckets', '''
+SELECT username,
+       node['name'] AS node,
+       floor(log(ended - started + 1, 2) * 4) AS bucket,
+       count(*) AS count,
+       sum(ended - started) AS total,
+       min(ended - started) AS "min",
+       max(ended - started) AS "max"
+FROM sys.jobs_log
+WHERE ended > CURRENT_TIMESTAMP - 60000
+  AND error IS NULL
+GROUP BY 1, 2, 3
+''', None)
+
 SETTINGS_QUERY = NamedQuery('settings', '''
 SELECT name,
        settings['stats']['enabled'] AS "stats_enabled",
@@ -109,6 +259,41 @@ VERSION_QUERY = NamedQuery('version', '''
 SELECT min(version['number']) AS version FROM sys.nodes
 ''', None)
 
+ATTRIBUTES_QUERY = NamedQuery('attributes', '''
+SELECT id, attributes FROM sys.nodes
+''', None)
+
+CHECKS_QUERY = NamedQuery('checks', '''
+SELECT id, severity, description
+FROM sys.checks
+WHERE passed = false
+ORDER BY severity DESC, id
+''', None)
+
+NODE_CHECKS_QUERY = NamedQuery('node_checks', '''
+SELECT id, severity, description, count(*) AS nodes
+FROM sys.node_checks
+WHERE passed = false
+  AND acknowledged = false
+GROUP BY 1, 2, 3
+ORDER BY severity DESC, id
+''', None)
+
+# aggregated per table and partition on the server, so that the result size
+# does not depend on the number of shards and relocating shards are neither
+# counted twice nor attributed to another key
+TABLES_QUERY = NamedQuery('tables', '''
+SELECT schema_name,
+       table_name,
+       partition_ident,
+       sum(num_docs) AS docs,
+       sum(size) AS size
+FROM sys.shards
+WHERE "primary" = true
+  AND state IN ('STARTED', 'RELOCATING')
+GROUP BY 1, 2, 3
+''', None)
+
 STATS_STMT = '''
 SET GLOBAL TRANSIENT "stats.enabled" = %s
 '''
@@ -120,35 +305,50 @@ def unwrap_task_result(callback):
     return inner
 
 
-def get_version(pool, callback):
-    task = asyncio.ensure_future(exec_query(pool, [VERSION_QUERY]))
-    task.add_done_callback(unwrap_task_result(callback))
-
-
 def toggle_stats(current_value, pool, callback):
     set_stmt = NamedQuery('toggle_stats', STATS_STMT, [not current_value])
     task = asyncio.ensure_future(exec_query(pool, [set_stmt, SETTINGS_QUERY]))
     task.add_done_callback(unwrap_task_result(callback))
 
 
+@functools.lru_cache(maxsize=None)
+def record_class(columns):
+    """
+    Return the ``Record`` namedtuple class for a tuple of column names.
+    Classes are cached so that each column signature is created only once.
+    """
+    return namedtuple('Record', columns)
+
+
 def resultset(cursor):
-    Record = namedtuple('Record', [c.name for c in cursor.description])
+    Record = record_class(tuple(c.name for c in cursor.description))
     return [Record(*r) for r in cursor]
 
 
 async def pool(args):
+    if args.protocol in ('http', 'https'):
+        from .transport import HttpPool
+        return HttpPool(args.host, args.port, user=args.user,
+                        password=args.password, ssl=args.protocol == 'https')
+    import aiopg
     return await aiopg.create_pool(host=args.host, port=args.port,
                                    user=args.user, password=args.password,
                                    enable_json=False, enable_hstore=False,
                                    enable_uuid=False)
 
 
-async def exec_query(pool, queries):
+async def exec_query(pool, queries, timeout=None):
     rs = {}
     async with pool.acquire() as conn:
         async with conn.cursor() as cur:
             for name, stmt, params in queries:
-                await cur.execute(stmt, params)
+                try:
+                    await asyncio.wait_for(cur.execute(stmt, params), timeout)
+                except asyncio.TimeoutError:
+                    # cancelling the execute() cancels the statement on the
+                    # server; the connection is not reused afterwards
+                    conn.close()
+                    raise QueryTimeout(name, timeout)
                 rs[name] = resultset(cur) if cur.rowcount > -1 else None
     return rs
 
@@ -157,43 +357,198 @@ class DataProvider:
 
     PROVIDERS = [
         VERSION_QUERY,
-        JOBS_QUERY,
         SETTINGS_QUERY,
     ]
 
-    def __init__(self, pool, consumer, interval):
+    BACKOFF_MIN = 1.0
+    BACKOFF_MAX = 30.0
+
+    # minimum seconds between two executions of expensive queries
+    INTERVALS = {
+        TABLES_QUERY.name: 30.0,
+        CHECKS_QUERY.name: 60.0,
+        NODE_CHECKS_QUERY.name: 60.0,
+    }
+
+    def __init__(self, pool, consumer, interval, timeout=None, connect=None,
+                 planner=None):
         self.pool = pool
         self.interval = interval
+        self.timeout = timeout
         self.consumer = consumer
+        self.connect = connect
+        self.planner = planner
         self.state = {}
-        get_version(self.pool, self.on_version)
-
-    def on_version(self, data):
+        self.last_success = {}
+        self.last_attempt = {}
+        self.attempt = 0
+        self.version = None
+        self.node_query = None
+        self.summary_query = None
+        self.job_buckets_query = None
+        self.queries = [VERSION_QUERY]
+        self.task = None
+        self.handle = None
+        self.refetch = False
+        self.probe_version()
+
+    def probe_version(self):
+        task = asyncio.ensure_future(
+            exec_query(self.pool, [VERSION_QUERY], self.timeout))
+        task.add_done_callback(self.on_version)
+
+    def on_version(self, t):
+        try:
+            data = t.result()
+        except Exception as e:
+            logger.warning('version probe failed: %s', e)
+            self.apply_failures({VERSION_QUERY.name: e})
+            self.reconnect()
+            return
         crate_version = StrictVersion(data['version'][0].version)
         logger.debug('version %s', crate_version)
+        self.version = crate_version
         if crate_version >= CRATE_2_3:
-            self.PROVIDERS += [NODE_QUERY_V_2_3]
+            self.node_query = NODE_QUERY_V_2_3
+            self.summary_query = NODE_SUMMARY_QUERY_V_2_3
         elif crate_version >= CRATE_2_0:
-            self.PROVIDERS += [NODE_QUERY_V_2_0]
+            self.node_query = NODE_QUERY_V_2_0
+            self.summary_query = NODE_SUMMARY_QUERY_V_2_0
         else:
-            raise ValueError('CrateDB {crate_version} is not supported.')
+            self.consumer.apply(failure=ValueError(
+                f'CrateDB {crate_version} is not supported.'))
+            return
+        if crate_version >= CRATE_4_0:
+            self.job_buckets_query = JOB_BUCKETS_QUERY
         self.fetch()
 
+    def plan(self):
+        """
+        Return the queries of the next refresh, based on what is currently
+        displayed: the jobs query only runs while its data is visible, and a
+        single row aggregation over ``sys.nodes`` and a light per node query
+        replace the per node query if no per node data is displayed. Queries
+        listed in ``INTERVALS`` run at most once per interval.
+        """
+        plan = self.planner is not None and self.planner() or FULL_PLAN
+        queries = list(self.PROVIDERS)
+        for query in (CHECKS_QUERY, NODE_CHECKS_QUERY):
+            if self.due(query):
+                queries.append(query)
+        if plan.jobs:
+            queries.append(JOBS_QUERY)
+            if self.job_buckets_query is not None:
+                queries.append(self.job_buckets_query)
+        if plan.attributes:
+            queries.append(ATTRIBUTES_QUERY)
+        if plan.tables and self.due(TABLES_QUERY):
+            queries.append(TABLES_QUERY)
+        if plan.nodes:
+            queries.append(self.node_query)
+        else:
+            queries.extend((NODE_VITALS_QUERY, self.summary_query))
+        return queries
+
+    def due(self, query):
+        # failing queries are retried at their interval too, so that an
+        # expensive query which times out does not slow down every refresh
+        last = self.last_attempt.get(query.name)
+        return last is None or \
+            time.time() - last >= self.INTERVALS.get(query.name, 0.0)
+
     def fetch(self, *args):
-        task = asyncio.ensure_future(exec_query(self.pool, self.PROVIDERS))
-        task.add_done_callback(self.on_result)
+        self.handle = None
+        self.queries = self.plan()
+        now = time.time()
+        for query in self.queries:
+            self.last_attempt[query.name] = now
+        self.task = asyncio.ensure_future(self.exec_queries(self.queries))
+        self.task.add_done_callback(self.on_result)
+
+    def refresh(self):
+        """
+        Fetch immediately, e.g. because the displayed view changed.
+        """
+        if self.node_query is None:
+            return
+        if self.task is not None and not self.task.done():
+            self.refetch = True
+        elif self.handle is not None:
+            self.handle.cancel()
+            self.fetch()
+
+    async def exec_queries(self, queries):
+        """
+        Execute the queries concurrently, each on its own pool connection,
+        so that a failing or hanging query neither prevents nor delays the
+        update of the others.
+        """
+        results = await asyncio.gather(
+            *(exec_query(self.pool, [query], self.timeout)
+              for query in queries),
+            return_exceptions=True)
+        state, errors = {}, {}
+        for query, result in zip(queries, results):
+            if isinstance(result, Exception):
+                errors[query.name] = result
+            else:
+                state.update(result)
+        if errors and not state:
+            # nothing succeeded, so the connection itself is most likely gone
+            raise next(iter(errors.values()))
+        return state, errors
 
     def on_result(self, t):
         try:
-            state = t.result()
+            state, errors = t.result()
         except Exception as e:
-            self.consumer.apply(failure=e)
+            logger.warning('fetch failed: %s', e)
+            self.apply_failures({q.name: e for q in self.queries})
+            self.reconnect()
         else:
+            self.attempt = 0
+            now = time.time()
+            for name in state:
+                self.last_success[name] = now
             self.consumer.apply(state)
             self.state.update(state)
-        finally:
-            loop = asyncio.get_event_loop()
-            loop.call_later(self.interval, self.fetch)
+            self.apply_failures(errors)
+            self.schedule(0 if self.refetch else self.interval)
+
+    def apply_failures(self, errors):
+        for name, error in errors.items():
+            logger.debug('query %s failed: %s', name, error)
+            self.consumer.apply(failure=QueryFailure(
+                name, error, self.last_success.get(name)))
+
+    def schedule(self, delay):
+        self.refetch = False
+        loop = asyncio.get_event_loop()
+        self.handle = loop.call_later(delay, self.fetch)
+
+    def reconnect(self):
+        delay = min(self.BACKOFF_MAX, self.BACKOFF_MIN * 2 ** self.attempt)
+        self.attempt += 1
+        logger.info('reconnecting in %.1fs (attempt %d)', delay, self.attempt)
+        loop = asyncio.get_event_loop()
+        loop.call_later(delay, lambda: asyncio.ensure_future(self._reconnect()))
+
+    async def _reconnect(self):
+        if self.connect is not None:
+            try:
+                pool = await self.connect()
+            except Exception as e:
+                logger.warning('reconnect failed: %s', e)
+                self.apply_failures({q.name: e for q in self.queries})
+                self.reconnect()
+                return
+            old, self.pool = self.pool, pool
+            if old is not None:
+                old.terminate()
+        if self.version is None:
+            self.probe_version()
+        else:
+            self.fetch()
 
     def __getitem__(self, key):
         return self.state.get(key)
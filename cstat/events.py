@@ -0,0 +1,90 @@
+# vi: set encoding=utf-8
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+
+from collections import deque
+from typing import NamedTuple
+from .log import get_logger
+
+logger = get_logger(__name__)
+
+JOINED = 'joined'
+LEFT = 'left'
+RESTARTED = 'restarted'
+
+
+class NodeEvent(NamedTuple):
+    timestamp: float
+    kind: str
+    node: str
+
+
+def node_events(prev, nodes, timestamp):
+    """
+    Return the membership and restart events between two ``NodeSnapshot``.
+
+    Membership is only diffed if the node ids changed. A node restarted if
+    its completed thread pool tasks, which only ever increase while the
+    process runs, decreased. Since any node may have restarted, this compares
+    the counters of all nodes and is O(nodes) per refresh; with unchanged
+    membership the counter columns are compared directly without aligning
+    them by node id.
+    """
+    if prev is None:
+        return []
+    events = []
+    if prev.ids == nodes.ids:
+        completed = prev.completed
+    else:
+        index = nodes.index
+        events.extend(NodeEvent(timestamp, LEFT, name)
+                      for node_id, name in zip(prev.ids, prev.names)
+                      if node_id not in index)
+        index = prev.index
+        events.extend(NodeEvent(timestamp, JOINED, name)
+                      for node_id, name in zip(nodes.ids, nodes.names)
+                      if node_id not in index)
+        completed = nodes.aligned(prev, 'completed')
+    events.extend(NodeEvent(timestamp, RESTARTED, name)
+                  for name, current, last in zip(nodes.names, nodes.completed,
+                                                 completed)
+                  if last is not None and current < last)
+    return events
+
+
+class EventLog:
+    """
+    Bounded log of the most recent node events, which are also written to
+    the log file.
+    """
+
+    def __init__(self, size=100):
+        self.events = deque(maxlen=size)
+
+    def __len__(self):
+        return len(self.events)
+
+    def __iter__(self):
+        return iter(self.events)
+
+    def extend(self, events):
+        for event in events:
+            logger.info('node %s %s', event.node, event.kind)
+            self.events.append(event)
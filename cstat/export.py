@@ -0,0 +1,176 @@
+# vi: set encoding=utf-8
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+
+import os
+import csv
+import time
+import queue
+import threading
+from .log import get_logger
+
+logger = get_logger(__name__)
+
+EXPORT_FORMATS = ['csv', 'parquet']
+
+NODE_COLUMNS = (
+    'cpu_used',
+    'process',
+    'heap_used',
+    'heap_max',
+    'mem_used',
+    'mem_total',
+    'fs_used',
+    'fs_size',
+    'fs_read',
+    'fs_written',
+    'net_tx',
+    'net_rx',
+    'load1',
+    'load5',
+    'load15',
+    'write_rejected',
+)
+
+JOBS_COLUMNS = (
+    'stmt',
+    'count',
+    'min',
+    'avg',
+    'max',
+    'median',
+    'perc95',
+    'perc99',
+)
+
+
+class Batch:
+    """
+    Column oriented in-memory buffer of rows of a single table.
+    """
+
+    def __init__(self, columns):
+        self.columns = {name: [] for name in columns}
+        self.rows = 0
+
+    def extend(self, **columns):
+        for name, values in columns.items():
+            self.columns[name].extend(values)
+        self.rows += len(next(iter(columns.values())))
+
+
+def write_csv(directory, table, batch):
+    # rolling hourly files, rows are appended to the file of the current hour
+    fn = os.path.join(directory, '{0}-{1}.csv'.format(
+        table, time.strftime('%Y%m%d-%H')))
+    header = not os.path.exists(fn)
+    with open(fn, 'a', newline='') as fp:
+        writer = csv.writer(fp)
+        if header:
+            writer.writerow(batch.columns.keys())
+        writer.writerows(zip(*batch.columns.values()))
+
+
+def write_parquet(directory, table, batch):
+    import pyarrow
+    import pyarrow.parquet
+    fn = os.path.join(directory, '{0}-{1}.parquet'.format(
+        table, int(time.time() * 1000)))
+    pyarrow.parquet.write_table(pyarrow.table(batch.columns), fn)
+
+
+class Exporter:
+    """
+    Buffers collected metrics into record batches and hands them to a
+    background thread which writes them to ``directory``, so that disk I/O
+    never runs on the event loop.
+
+    Batches are flushed once they hold ``max_rows`` rows or when they are
+    older than ``max_age`` seconds.
+    """
+
+    def __init__(self, directory, fmt='csv', max_rows=10000, max_age=60.0):
+        if fmt == 'parquet':
+            try:
+                import pyarrow.parquet  # noqa
+            except ImportError:
+                raise ValueError('parquet export requires pyarrow, '
+                                 'install cstat[parquet]')
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self.write = fmt == 'parquet' and write_parquet or write_csv
+        self.max_rows = max_rows
+        self.max_age = max_age
+        self.batches = {}
+        self.created = time.time()
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.run,
+                                       name='cstat-export', daemon=True)
+        self.thread.start()
+
+    def batch(self, table, columns):
+        if table not in self.batches:
+            self.batches[table] = Batch(columns)
+        return self.batches[table]
+
+    def add_nodes(self, nodes):
+        if not len(nodes):
+            return
+        batch = self.batch('nodes', ('timestamp', 'id', 'name') + NODE_COLUMNS)
+        batch.extend(timestamp=nodes.hosttime, id=nodes.ids, name=nodes.names,
+                     **{name: getattr(nodes, name) for name in NODE_COLUMNS})
+        self.maybe_flush()
+
+    def add_jobs(self, jobs, timestamp=None):
+        if not jobs:
+            return
+        batch = self.batch('jobs', ('timestamp', ) + JOBS_COLUMNS)
+        batch.extend(timestamp=[timestamp or time.time()] * len(jobs),
+                     **{name: [getattr(r, name) for r in jobs]
+                        for name in JOBS_COLUMNS})
+        self.maybe_flush()
+
+    def maybe_flush(self):
+        if time.time() - self.created >= self.max_age or \
+                any(b.rows >= self.max_rows for b in self.batches.values()):
+            self.flush()
+
+    def flush(self):
+        if self.batches:
+            self.queue.put(self.batches)
+        self.batches = {}
+        self.created = time.time()
+
+    def close(self):
+        self.flush()
+        self.queue.put(None)
+        self.thread.join()
+
+    def run(self):
+        while True:
+            batches = self.queue.get()
+            if batches is None:
+                break
+            for table, batch in batches.items():
+                try:
+                    self.write(self.directory, table, batch)
+                except Exception as e:
+                    logger.warning('could not export %s: %s', table, e)
@@ -0,0 +1,91 @@
+# vi: set encoding=utf-8
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+
+import re
+from .log import get_logger
+
+logger = get_logger(__name__)
+
+UNGROUPED = '-'
+
+
+class GroupIndex:
+    """
+    Maps node positions of a ``NodeSnapshot`` to groups, either by the value
+    of a node attribute or by a regular expression applied to the hostname.
+
+    The index is only rebuilt when the node ids of a snapshot differ from the
+    ones it was built for, or when new node attributes arrived.
+    """
+
+    def __init__(self, attribute=None, pattern=None):
+        self.attribute = attribute
+        self.pattern = pattern and re.compile(pattern)
+        self.attributes = None
+        self.ids = None
+        self.missing = False
+        self.labels = []
+        self.members = []
+
+    @property
+    def needs_attributes(self):
+        return self.attribute is not None and (
+            self.attributes is None or self.missing)
+
+    def set_attributes(self, records):
+        self.attributes = {r.id: r.attributes or {} for r in records}
+        self.ids = None
+
+    def key(self, node_id, hostname):
+        if self.pattern is not None:
+            match = self.pattern.search(hostname)
+            if match is None:
+                return UNGROUPED
+            return match.groups() and match.group(1) or match.group(0)
+        value = (self.attributes or {}).get(node_id, {}).get(self.attribute)
+        return value is None and UNGROUPED or str(value)
+
+    def update(self, nodes):
+        """
+        Rebuild the index if the membership of ``nodes`` changed. Returns
+        ``True`` if the index was rebuilt.
+        """
+        if nodes.ids == self.ids:
+            return False
+        groups = {}
+        for idx, (node_id, hostname) in enumerate(zip(nodes.ids, nodes.hostnames)):
+            groups.setdefault(self.key(node_id, hostname), []).append(idx)
+        self.labels = sorted(groups)
+        self.members = [groups[label] for label in self.labels]
+        self.ids = list(nodes.ids)
+        self.missing = self.attribute is not None and \
+            any(i not in (self.attributes or {}) for i in self.ids)
+        logger.debug('rebuilt group index: %s', self.labels)
+        return True
+
+    def aggregate(self, values):
+        """
+        Sum a per node column into one value per group. ``None`` values are
+        skipped.
+        """
+        return [sum(values[idx] for idx in members
+                    if values[idx] is not None)
+                for members in self.members]
@@ -0,0 +1,154 @@
+# vi: set encoding=utf-8
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+
+import sys
+import time
+import zlib
+import queue
+import threading
+from collections import deque
+from .cache import encode_state, decode_state
+from .log import get_logger
+
+logger = get_logger(__name__)
+
+# approximate size of the list, sequence number and timestamp of a frame
+FRAME_OVERHEAD = 120
+
+# indices of the fields of a frame
+SEQ, TIMESTAMP, NAMES, STATE, BLOB = range(5)
+
+
+def frame_size(frame):
+    return len(frame[BLOB]) + sys.getsizeof(frame[NAMES]) + FRAME_OVERHEAD
+
+
+class History:
+    """
+    Bounded buffer of the most recent query results, used to scrub through
+    recent refreshes while the display is paused.
+
+    Results are compressed by a background thread, so that encoding never
+    runs on the event loop. Until then a frame keeps a reference to the
+    result itself. The buffer is capped by the total size of the compressed
+    results in bytes, so that the number of kept refreshes adapts to the
+    size of the cluster.
+    """
+
+    def __init__(self, max_bytes=16 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.frames = deque()
+        self.pending = deque()
+        self.size = 0
+        self.seq = 0
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.run,
+                                       name='cstat-history', daemon=True)
+        self.thread.start()
+
+    def __len__(self):
+        return len(self.frames)
+
+    def append(self, state, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+        self.seq += 1
+        # names of non-empty results, to find frames without decoding them
+        names = frozenset(name for name, value in state.items() if value)
+        frame = [self.seq, timestamp, names, state, None]
+        self.frames.append(frame)
+        self.pending.append(frame)
+        self.queue.put(frame)
+        self.collect()
+
+    def collect(self):
+        """
+        Account the frames compressed by the background thread, drop their
+        uncompressed results and evict the oldest frames beyond the size
+        limit.
+        """
+        pending = self.pending
+        while pending and pending[0][BLOB] is not None:
+            frame = pending.popleft()
+            if frame[BLOB] is False:
+                # the result could not be encoded, keep the frame empty
+                frame[NAMES], frame[BLOB] = frozenset(), b''
+            frame[STATE] = None
+            self.size += frame_size(frame)
+        while self.size > self.max_bytes and len(self.frames) > 1 and \
+                self.frames[0][STATE] is None:
+            self.size -= frame_size(self.frames.popleft())
+
+    def run(self):
+        while True:
+            frame = self.queue.get()
+            if frame is None:
+                break
+            try:
+                frame[BLOB] = zlib.compress(encode_state(frame[STATE]), 1)
+            except TypeError as e:
+                logger.debug('result not added to history: %s', e)
+                frame[BLOB] = False
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    def position(self, seq):
+        """
+        Return the position of the frame with the sequence number ``seq``,
+        or of the oldest frame if it was already evicted.
+        """
+        if not self.frames:
+            return None
+        return max(0, min(len(self.frames) - 1, seq - self.frames[0][SEQ]))
+
+    def __getitem__(self, pos):
+        """
+        Return ``(seq, timestamp, state)`` of the frame at ``pos``.
+        """
+        frame = self.frames[pos]
+        # the state is only dropped on this thread, after the blob was set
+        state = frame[STATE]
+        if state is None:
+            # frames whose result could not be encoded are kept empty
+            state = frame[BLOB] and decode_state(
+                zlib.decompress(frame[BLOB])) or {}
+        return frame[SEQ], frame[TIMESTAMP], state
+
+    def since(self, seq):
+        """
+        Return the positions of all frames newer than ``seq``.
+        """
+        if not self.frames:
+            return range(0)
+        return range(max(0, seq + 1 - self.frames[0][SEQ]), len(self.frames))
+
+    def previous(self, pos, name):
+        """
+        Return ``(timestamp, records)`` of the newest frame before ``pos``
+        which contains the result ``name``, or ``None``.
+        """
+        for idx in range(pos - 1, -1, -1):
+            if name in self.frames[idx][NAMES]:
+                seq, timestamp, state = self[idx]
+                return timestamp, state[name]
+        return None
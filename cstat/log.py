@@ -19,18 +19,59 @@
 # software solely pursuant to the terms of the relevant commercial agreement.
 
 import os
+import queue
+import atexit
 import logging
+import logging.handlers
 import appdirs
 
+LOG_LEVELS = ['debug', 'info', 'warning', 'error', 'critical']
+LOG_FORMAT = '%(asctime)s %(levelname)-7s %(name)s: %(message)s'
+
+# all cstat modules log into the "cstat" logger hierarchy; until logging is
+# set up, records are discarded instead of being printed onto the terminal
+_root = logging.getLogger('cstat')
+_root.addHandler(logging.NullHandler())
+_root.propagate = False
+
+_listener = None
+
 
 def get_logger(name):
+    return logging.getLogger(name)
+
+
+def log_file():
     log_dir = appdirs.user_log_dir('cstat', 'chaudum')
     if not os.path.exists(log_dir):
         os.makedirs(log_dir)
-    fn = os.path.join(log_dir, 'cstat.log')
-    logger = logging.getLogger(name)
-    handler = logging.FileHandler(fn)
-    handler.setLevel(logging.DEBUG)
-    logger.addHandler(handler)
-    logger.setLevel(logging.DEBUG)
-    return logger
+    return os.path.join(log_dir, 'cstat.log')
+
+
+def setup_logging(level='info'):
+    """
+    Attach a single queue handler to the "cstat" logger.
+
+    Log records are only enqueued on the calling (event loop) thread,
+    formatting and writing to the log file happens on the background thread
+    of a ``QueueListener``.
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+    handler = logging.FileHandler(log_file())
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    q = queue.Queue(-1)
+    _root.handlers = [logging.handlers.QueueHandler(q)]
+    _root.setLevel(getattr(logging, level.upper()))
+    _listener = logging.handlers.QueueListener(q, handler)
+    _listener.start()
+    atexit.register(shutdown_logging)
+    return _listener
+
+
+def shutdown_logging():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
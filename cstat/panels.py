@@ -0,0 +1,191 @@
+# vi: set encoding=utf-8
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+
+import time
+import asyncio
+from collections import deque
+from .config import sections, parse_duration
+from .connector import NamedQuery, QueryFailure, exec_query
+from .log import get_logger
+
+logger = get_logger(__name__)
+
+RENDERS = ('table', 'bar', 'sparkline')
+
+
+class Panel:
+    """
+    A user defined query which is shown in its own box on the panels tab,
+    either as a table, as one bar per row or as a sparkline of its history.
+
+    The last result is kept, so that a panel which becomes visible again
+    is painted immediately and only queried once its interval expired.
+    """
+
+    def __init__(self, name, stmt, interval=10.0, render='table', value=None,
+                 label=None, maximum=None, rate=False, history=60, title=None):
+        if render not in RENDERS:
+            raise ValueError(f'panel {name}: unknown render {render}')
+        if interval <= 0:
+            raise ValueError(f'panel {name}: interval must be positive')
+        self.name = name
+        self.title = title or name
+        self.query = NamedQuery(f'panel:{name}', stmt, None)
+        self.interval = interval
+        self.render = render
+        self.value = value
+        self.label = label
+        self.maximum = maximum
+        self.rate = rate
+        self.history = deque(maxlen=history)
+        self.columns = ()
+        self.rows = []
+        self.labels = []
+        self.values = []
+        self.last_success = None
+        self.prev = None
+        self.handle = None
+        self.task = None
+
+    @classmethod
+    def from_section(cls, name, section):
+        stmt = section.get('sql')
+        if not stmt:
+            raise ValueError(f'panel {name}: missing sql')
+        maximum = section.get('max')
+        return cls(name,
+                   stmt,
+                   interval=parse_duration(section.get('interval', '10s')),
+                   render=section.get('render', 'table'),
+                   value=section.get('value'),
+                   label=section.get('label'),
+                   maximum=float(maximum) if maximum else None,
+                   rate=section.getboolean('rate', False),
+                   history=section.getint('history', 60),
+                   title=section.get('title'))
+
+    @property
+    def idle(self):
+        return self.handle is None and (self.task is None or self.task.done())
+
+    def update(self, rows, now):
+        """
+        Apply a result of the query. Raises if the ``value`` or ``label``
+        column is missing or the value is not a number, in which case the
+        panel keeps its previous result.
+        """
+        rows = rows or []
+        columns = rows and rows[0]._fields or self.columns
+        if self.render != 'table' and columns:
+            self.update_values(rows, columns, now)
+        self.rows = rows
+        self.columns = columns
+        self.last_success = now
+
+    def update_values(self, rows, columns, now):
+        value = self.value or columns[-1]
+        labels = [self.label and str(getattr(r, self.label)) or self.name
+                  for r in rows]
+        values = [float(getattr(r, value) or 0.0) for r in rows]
+        if self.rate:
+            # per second change of the value since the previous result
+            prev, self.prev = self.prev, (now, dict(zip(labels, values)))
+            if prev is None or now <= prev[0]:
+                values = [None] * len(values)
+            else:
+                elapsed = now - prev[0]
+                values = [(v - prev[1][l]) / elapsed if l in prev[1] else None
+                          for l, v in zip(labels, values)]
+        self.labels = labels
+        self.values = values
+        known = [v for v in values if v is not None]
+        if self.render == 'sparkline' and known:
+            self.history.append(sum(known))
+
+
+def load_panels(config):
+    return [Panel.from_section(name, section)
+            for name, section in sections(config, 'panel')]
+
+
+class PanelScheduler:
+    """
+    Queries every panel at its own interval, independent of the refresh of
+    the node data. Panels that are not visible are not queried; they are
+    refreshed when they become visible and their interval expired.
+    """
+
+    def __init__(self, panels, provider, consumer, visible, timeout=None):
+        self.panels = panels
+        self.provider = provider
+        self.consumer = consumer
+        self.visible = visible
+        self.timeout = timeout
+
+    def refresh(self):
+        """
+        Schedule all visible panels that are not scheduled yet.
+        """
+        now = time.time()
+        for panel in self.panels:
+            if panel.idle and self.visible(panel):
+                if panel.last_success is None:
+                    self.schedule(panel, 0.0)
+                else:
+                    self.schedule(panel, max(
+                        0.0, panel.last_success + panel.interval - now))
+
+    def schedule(self, panel, delay):
+        loop = asyncio.get_event_loop()
+        panel.handle = loop.call_later(delay, self.fetch, panel)
+
+    def fetch(self, panel):
+        panel.handle = None
+        # the pool is replaced by the provider when it reconnects
+        pool = self.provider.pool
+        if not self.visible(panel):
+            return
+        if pool is None:
+            # not connected yet, try again once the provider reconnected
+            self.schedule(panel, panel.interval)
+            return
+        panel.task = asyncio.ensure_future(
+            exec_query(pool, [panel.query], self.timeout))
+        panel.task.add_done_callback(lambda t: self.on_result(panel, t))
+
+    def on_result(self, panel, t):
+        try:
+            rs = t.result()
+            # a misconfigured value or label column fails like the query
+            panel.update(rs.get(panel.query.name), time.time())
+        except Exception as e:
+            logger.debug('panel %s failed: %s', panel.name, e)
+            self.consumer.apply(failure=QueryFailure(
+                panel.query.name, e, panel.last_success))
+        else:
+            self.consumer.apply(panel)
+        self.schedule(panel, panel.interval)
+
+    def cancel(self):
+        for panel in self.panels:
+            if panel.handle is not None:
+                panel.handle.cancel()
+                panel.handle = None
@@ -21,12 +21,15 @@
 import asyncio
 import getpass
 import argparse
-from .command import CrateStat
+from .log import LOG_LEVELS, setup_logging
+from .export import EXPORT_FORMATS
 
 __version__ = '0.1.0'
 
 EXIT_SUCCESS, EXIT_ERROR = 0, 1
 
+DEFAULT_PORTS = {'psql': 5432, 'http': 4200, 'https': 4200}
+
 
 def red(text: str) -> str:
     return f'\033[31m{text}\033[0m'
@@ -40,24 +43,35 @@ def yellow(text: str) -> str:
     return f'\033[33m{text}\033[0m'
 
 
-def parse_cli():
+def connection_arguments():
     """
-    Parse command line arguments
+    Arguments of the connection to the cluster, which are used by the UI
+    and by the collector command
     """
-    parser = argparse.ArgumentParser('cstat',
-                                     description='A visual stat tool for CrateDB clusters')
+    parser = argparse.ArgumentParser(add_help=False)
     parser.add_argument('--host', '--crate-host',
                         help='CrateDB host to connect to',
                         type=str, metavar='HOST',
                         default='127.0.0.1')
     parser.add_argument('--port', '--psql-port',
-                        help='PSQL port of CrateDB host',
+                        help='port of CrateDB host (default: 5432 for psql, '
+                             '4200 for http and https)',
                         type=int, metavar='PORT',
-                        default=5432)
+                        default=None)
+    parser.add_argument('--protocol',
+                        help='protocol used to query CrateDB, http and https '
+                             'use the _sql endpoint',
+                        choices=sorted(DEFAULT_PORTS),
+                        default='psql',
+                        type=str.lower)
     parser.add_argument('--interval', '--refresh-interval',
                         help='amount of time in seconds between each update',
                         default=2,
                         type=float)
+    parser.add_argument('--timeout', '--query-timeout',
+                        help='amount of time in seconds after which a query is cancelled',
+                        default=10,
+                        type=float)
     parser.add_argument('--user', '--db-user',
                         help='database user',
                         default=None,
@@ -74,18 +88,94 @@ def parse_cli():
                         help='prompt for user password',
                         action='store_true',
                         default=False)
+    parser.add_argument('--log-level',
+                        help='level of messages written to the log file',
+                        choices=LOG_LEVELS,
+                        default='info',
+                        type=str.lower)
+    return parser
+
+
+def parse_cli():
+    """
+    Parse command line arguments
+    """
+    common = connection_arguments()
+    parser = argparse.ArgumentParser('cstat',
+                                     description='A visual stat tool for CrateDB clusters',
+                                     parents=[common])
+    parser.add_argument('--deviation', '--outlier-deviation',
+                        help='flag nodes whose utilization deviates more than '
+                             'this fraction from the cluster median',
+                        default=0.2,
+                        type=float)
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--group-by',
+                       help='group nodes by the value of this node attribute',
+                       default=None,
+                       type=str, metavar='ATTRIBUTE')
+    group.add_argument('--group-regex',
+                       help='group nodes by the first group (or the match) of '
+                            'this regular expression applied to the hostname',
+                       default=None,
+                       type=str, metavar='REGEX')
+    parser.add_argument('--config',
+                        help='configuration file with alert rules '
+                             '(default: cstat.ini in the user config directory)',
+                        default=None,
+                        type=str)
+    parser.add_argument('--export',
+                        help='directory to which collected metrics are exported',
+                        default=None,
+                        type=str, metavar='DIR')
+    parser.add_argument('--export-format',
+                        help='file format of exported metrics',
+                        choices=EXPORT_FORMATS,
+                        default='csv',
+                        type=str)
+    parser.add_argument('--history-size',
+                        help='memory in MiB used to keep recent results for '
+                             'scrubbing while the display is paused',
+                        default=16,
+                        type=float, metavar='MIB')
+    parser.add_argument('--attach',
+                        help='attach to the Unix socket of a running collector '
+                             'instead of querying the cluster',
+                        default=None,
+                        type=str, metavar='SOCKET')
     parser.add_argument('--version', action='version', version=__version__)
+    commands = parser.add_subparsers(dest='command')
+    collector = commands.add_parser('collector',
+                                    help='poll the cluster once and publish '
+                                         'the results to attached cstat UIs')
+    collector.add_argument('--socket',
+                           help='path of the Unix socket to publish on '
+                                '(default: in the user cache directory)',
+                           default=None,
+                           type=str)
     return parser.parse_args()
 
 
 def main():
     args = parse_cli()
+    setup_logging(args.log_level)
+    if args.port is None:
+        args.port = DEFAULT_PORTS[args.protocol]
     if args.prompt_user and not args.user:
         args.user = input('User: ')
     if args.prompt_password and not args.password:
         args.password = getpass.getpass()
+    if args.command == 'collector':
+        from .collector import run_collector
+        return run_collector(args)
+    # urwid and aiopg are imported late so --help and --version stay fast
+    from .command import CrateStat
     aioloop = asyncio.get_event_loop()
-    ui = CrateStat(args)
+    try:
+        ui = CrateStat(args)
+    except ValueError as e:
+        print(red('Invalid configuration: ') + str(e))
+        return EXIT_ERROR
     try:
         ui.serve(aioloop)
     except Exception as e:
@@ -0,0 +1,226 @@
+# vi: set encoding=utf-8
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+
+import re
+import time
+import operator
+from typing import NamedTuple
+from .config import sections, parse_duration
+from .stats import ratios
+from .log import get_logger
+
+logger = get_logger(__name__)
+
+RE_CONDITION = re.compile(
+    r'^\s*(?P<metric>[\w/]+)\s*(?P<op>>=|<=|>|<)\s*'
+    r'(?P<threshold>-?\d+(?:\.\d+)?)\s*%?\s*$')
+
+OPERATORS = {
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+}
+
+# relative margin between the threshold that fires a rule and the threshold
+# that clears it again, if the rule does not define one
+HYSTERESIS = 0.05
+
+
+def _column(name):
+    def metric(nodes, prev):
+        return getattr(nodes, name)
+    return metric
+
+
+def _percent(current, total):
+    def metric(nodes, prev):
+        return [100.0 * v for v in ratios(getattr(nodes, current),
+                                          getattr(nodes, total))]
+    return metric
+
+
+def _rate(name, timestamp):
+    def metric(nodes, prev):
+        return [v or 0.0 for v in nodes.rates(prev, name, timestamp)]
+    return metric
+
+
+def _mean(values):
+    return len(values) and sum(values) / len(values) or 0.0
+
+
+# metric name -> (per node column, cluster wide aggregation)
+METRICS = {
+    'cpu': (_column('cpu_used'), _mean),
+    'process': (_column('process'), _mean),
+    'heap': (_percent('heap_used', 'heap_max'), _mean),
+    'mem': (_percent('mem_used', 'mem_total'), _mean),
+    'disk': (_percent('fs_used', 'fs_size'), _mean),
+    'load1': (_column('load1'), _mean),
+    'load5': (_column('load5'), _mean),
+    'load15': (_column('load15'), _mean),
+    'net_tx/s': (_rate('net_tx', 'net_timestamp'), sum),
+    'net_rx/s': (_rate('net_rx', 'net_timestamp'), sum),
+    'disk_read/s': (_rate('fs_read', 'hosttime'), sum),
+    'disk_write/s': (_rate('fs_written', 'hosttime'), sum),
+    'write_rejections/s': (_rate('write_rejected', 'hosttime'), sum),
+}
+
+
+class Alert(NamedTuple):
+    rule: str
+    node: str
+    value: float
+
+
+class Rule:
+    """
+    A threshold rule such as ``heap > 85`` that fires once the condition
+    held for ``duration`` seconds on a node (or on the cluster aggregate if
+    ``scope`` is ``cluster``) and clears when the value no longer exceeds
+    the ``clear`` threshold.
+    """
+
+    def __init__(self, name, metric, op, threshold, duration=0.0,
+                 clear=None, scope='node', command=None, bell=False):
+        if metric not in METRICS:
+            raise ValueError(f'rule {name}: unknown metric {metric}')
+        if scope not in ('node', 'cluster'):
+            raise ValueError(f'rule {name}: unknown scope {scope}')
+        self.name = name
+        self.metric = metric
+        self.op = op
+        self.breach = OPERATORS[op]
+        self.threshold = threshold
+        if clear is None:
+            margin = abs(threshold) * HYSTERESIS
+            clear = threshold - margin if op.startswith('>') else threshold + margin
+        self.clear = clear
+        self.duration = duration
+        self.scope = scope
+        self.command = command
+        self.bell = bell
+        # extreme value of a column that decides whether any node breaches
+        self.peak = op.startswith('>') and max or min
+        self.pending = {}
+        self.active = {}
+
+    @classmethod
+    def from_section(cls, name, section):
+        match = RE_CONDITION.match(section.get('when', ''))
+        if match is None:
+            raise ValueError(f'rule {name}: invalid condition '
+                             f'{section.get("when")!r}')
+        clear = section.get('clear')
+        return cls(name,
+                   match.group('metric'),
+                   match.group('op'),
+                   float(match.group('threshold')),
+                   duration=parse_duration(section.get('for', '0')),
+                   clear=float(clear.rstrip('% ')) if clear else None,
+                   scope=section.get('scope', 'node'),
+                   command=section.get('command'),
+                   bell=section.getboolean('bell', False))
+
+    def evaluate(self, values, labels, now):
+        """
+        Update the state of the rule and return the labels of the nodes for
+        which the rule fired in this evaluation.
+        """
+        if not self.pending and not self.active:
+            # the common case: nothing pending, nothing breaching
+            if not len(values) or not self.breach(self.peak(values), self.threshold):
+                return []
+        fired = []
+        for label, value in zip(labels, values):
+            if label in self.active:
+                if self.breach(value, self.clear):
+                    self.active[label] = value
+                else:
+                    del self.active[label]
+            elif self.breach(value, self.threshold):
+                since = self.pending.setdefault(label, now)
+                if now - since >= self.duration:
+                    del self.pending[label]
+                    self.active[label] = value
+                    fired.append(label)
+            else:
+                self.pending.pop(label, None)
+        if len(self.active) + len(self.pending) > 0:
+            present = set(labels)
+            for state in (self.active, self.pending):
+                for label in [l for l in state if l not in present]:
+                    del state[label]
+        return fired
+
+
+class RuleEngine:
+
+    def __init__(self, rules):
+        self.rules = rules
+        self.prev = None
+
+    @classmethod
+    def from_config(cls, config):
+        return cls([Rule.from_section(name, section)
+                    for name, section in sections(config, 'rule')])
+
+    def __len__(self):
+        return len(self.rules)
+
+    def evaluate(self, nodes, now=None):
+        """
+        Evaluate all rules against a ``NodeSnapshot`` and return the newly
+        fired alerts. Each metric column is computed at most once per call.
+        """
+        if now is None:
+            now = time.time()
+        columns = {}
+        fired = []
+        for rule in self.rules:
+            key = (rule.metric, rule.scope)
+            if key not in columns:
+                column, aggregate = METRICS[rule.metric]
+                values = column(nodes, self.prev)
+                if rule.scope == 'cluster':
+                    columns[key] = ([aggregate(values)], ['cluster'])
+                else:
+                    columns[key] = (values, nodes.names)
+            values, labels = columns[key]
+            for label in rule.evaluate(values, labels, now):
+                alert = Alert(rule.name, label, rule.active[label])
+                logger.warning('alert %s fired on %s: %s %s %s (%.2f)',
+                               rule.name, label, rule.metric, rule.op,
+                               rule.threshold, alert.value)
+                fired.append(alert)
+        self.prev = nodes
+        return fired
+
+    def alerts(self):
+        return [Alert(rule.name, label, value)
+                for rule in self.rules
+                for label, value in rule.active.items()]
+
+    def rule(self, name):
+        for rule in self.rules:
+            if rule.name == name:
+                return rule
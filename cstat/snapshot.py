@@ -0,0 +1,311 @@
+# vi: set encoding=utf-8
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+
+from array import array
+from datetime import datetime
+from .stats import Distribution
+
+# thread pools that reject write requests, depending on the CrateDB version
+WRITE_POOLS = frozenset(['index', 'bulk', 'write'])
+
+
+def epoch(value):
+    """
+    Convert a timestamp column value, which is either a ``datetime`` or
+    milliseconds since epoch, into seconds since epoch.
+    """
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return value / 1000.0
+
+
+def column(typecode='d'):
+    return array(typecode)
+
+
+class ColumnarSnapshot:
+    """
+    Base class of columnar snapshots.
+
+    Every metric is stored as an ``array`` of doubles where position ``i``
+    belongs to the key ``ids[i]``. ``index`` maps keys to positions so that
+    counters of two snapshots can be matched even if keys were added or
+    removed in between.
+    """
+
+    METRICS = ()
+
+    def __init__(self):
+        self.ids = []
+        self.names = []
+        for metric in self.METRICS:
+            setattr(self, metric, column())
+
+    def build_index(self):
+        self.index = {key: idx for idx, key in enumerate(self.ids)}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def total(self, metric):
+        return sum(getattr(self, metric))
+
+    def mean(self, metric):
+        return len(self.ids) and self.total(metric) / len(self.ids) or 0.0
+
+    def aligned(self, prev, metric):
+        """
+        Return the values of ``metric`` of the ``prev`` snapshot in the order
+        of the keys of this snapshot. Keys that did not exist in ``prev``
+        have the value ``None``.
+        """
+        values = getattr(prev, metric)
+        if prev.ids == self.ids:
+            return values
+        index = prev.index
+        return [values[index[i]] if i in index else None for i in self.ids]
+
+    def rates(self, prev, metric, timestamp):
+        """
+        Calculate the per second rate of the counter ``metric`` for each key
+        since the ``prev`` snapshot, using ``timestamp`` as time column.
+
+        The rate is ``None`` for keys that are new or whose timestamp did not
+        advance since the previous snapshot.
+        """
+        if prev is None:
+            return [None] * len(self.ids)
+        prev_values = self.aligned(prev, metric)
+        prev_ts = self.aligned(prev, timestamp)
+        return [
+            (v - pv) / (t - pt) if pt is not None and t > pt else None
+            for v, pv, t, pt in zip(getattr(self, metric), prev_values,
+                                    getattr(self, timestamp), prev_ts)
+        ]
+
+
+class NodeSnapshot(ColumnarSnapshot):
+    """
+    Columnar representation of a single ``sys.nodes`` poll, keyed by node id.
+    """
+
+    METRICS = (
+        'cpu_used',
+        'process',
+        'heap_used',
+        'heap_max',
+        'heap_timestamp',
+        'mem_used',
+        'mem_total',
+        'fs_used',
+        'fs_size',
+        'fs_read',
+        'fs_written',
+        'hosttime',
+        'net_timestamp',
+        'net_tx',
+        'net_rx',
+        'load1',
+        'load5',
+        'load15',
+        'write_rejected',
+        'completed',
+    )
+
+    def __init__(self, records):
+        super().__init__()
+        self.hostnames = []
+        for r in records:
+            self.ids.append(r.id)
+            self.names.append(r.name)
+            self.hostnames.append(r.hostname)
+            self.cpu_used.append(min(r.cpu_used, 100))
+            self.process.append(r.process['percent'])
+            self.heap_used.append(r.heap['used'])
+            self.heap_max.append(r.heap['max'])
+            self.heap_timestamp.append(epoch(r.heap['probe_timestamp']))
+            self.mem_used.append(r.mem['used'])
+            self.mem_total.append(r.mem['free'] + r.mem['used'])
+            fs = r.fs_total
+            self.fs_used.append(fs['used'])
+            self.fs_size.append(fs['size'])
+            self.fs_read.append(fs['bytes_read'])
+            self.fs_written.append(fs['bytes_written'])
+            self.hosttime.append(epoch(r.hosttime))
+            self.net_timestamp.append(epoch(r.net_timestamp))
+            self.net_tx.append(r.net_packets['sent'])
+            self.net_rx.append(r.net_packets['received'])
+            self.load1.append(r.load['1'])
+            self.load5.append(r.load['5'])
+            self.load15.append(r.load['15'])
+            self.write_rejected.append(sum(
+                rejected for name, rejected in zip(r.pool_names or [],
+                                                   r.pool_rejected or [])
+                if name in WRITE_POOLS))
+            # only decreases if the node was restarted
+            self.completed.append(sum(r.pool_completed or []))
+        self.build_index()
+
+
+class VitalsSnapshot(ColumnarSnapshot):
+    """
+    The subset of ``NodeSnapshot`` which is accumulated on every refresh,
+    from the light ``NODE_VITALS_QUERY``.
+    """
+
+    METRICS = (
+        'heap_used',
+        'heap_max',
+        'heap_timestamp',
+        'fs_used',
+        'fs_size',
+        'hosttime',
+        'completed',
+    )
+
+    def __init__(self, records):
+        super().__init__()
+        for r in records:
+            self.ids.append(r.id)
+            self.names.append(r.name)
+            self.heap_used.append(r.heap['used'])
+            self.heap_max.append(r.heap['max'])
+            self.heap_timestamp.append(epoch(r.heap['probe_timestamp']))
+            self.fs_used.append(r.fs_used)
+            self.fs_size.append(r.fs_size)
+            self.hosttime.append(epoch(r.hosttime))
+            self.completed.append(sum(r.pool_completed or []))
+        self.build_index()
+
+
+class DeviceSnapshot(ColumnarSnapshot):
+    """
+    Columnar representation of the data path disks of all nodes, keyed by
+    ``(node id, device)``.
+    """
+
+    METRICS = (
+        'used',
+        'size',
+        'reads',
+        'writes',
+        'bytes_read',
+        'bytes_written',
+        'hosttime',
+    )
+
+    def __init__(self, records):
+        super().__init__()
+        for r in records:
+            data_devs = set(r.fs_data_dev or [])
+            disks = zip(r.disk_dev or [], r.disk_size or [], r.disk_used or [],
+                        r.disk_reads or [], r.disk_writes or [],
+                        r.disk_bytes_read or [], r.disk_bytes_written or [])
+            hosttime = epoch(r.hosttime)
+            for dev, size, used, reads, writes, bytes_read, bytes_written in disks:
+                if dev not in data_devs:
+                    continue
+                self.ids.append((r.id, dev))
+                self.names.append('{0}:{1}'.format(r.name, dev))
+                self.size.append(size)
+                self.used.append(used)
+                self.reads.append(reads)
+                self.writes.append(writes)
+                self.bytes_read.append(bytes_read)
+                self.bytes_written.append(bytes_written)
+                self.hosttime.append(hosttime)
+        self.build_index()
+
+
+class TableSnapshot(ColumnarSnapshot):
+    """
+    Columnar representation of the document count and size of every table
+    and partition, keyed by ``(schema, table, partition)``.
+    """
+
+    METRICS = (
+        'docs',
+        'size',
+        'timestamp',
+    )
+
+    def __init__(self, records, timestamp):
+        super().__init__()
+        for r in records:
+            self.ids.append((r.schema_name, r.table_name, r.partition_ident))
+            name = '{0}.{1}'.format(r.schema_name, r.table_name)
+            if r.partition_ident:
+                name += '[{0}]'.format(r.partition_ident)
+            self.names.append(name)
+            self.docs.append(r.docs or 0)
+            self.size.append(r.size or 0)
+            self.timestamp.append(timestamp)
+        self.build_index()
+
+
+class ClusterSummary:
+    """
+    Cluster wide totals of a single row aggregation over ``sys.nodes``,
+    including the distribution of the per node utilization.
+    """
+
+    METRICS = (
+        'cpu_used',
+        'process',
+        'heap_used',
+        'heap_max',
+        'mem_used',
+        'mem_total',
+        'fs_used',
+        'fs_size',
+        'fs_read',
+        'fs_written',
+        'net_tx',
+        'net_rx',
+        'load1',
+        'load5',
+        'load15',
+    )
+
+    DISTRIBUTIONS = ('cpu', 'process', 'heap', 'mem', 'disk')
+
+    def __init__(self, record):
+        self.num = record.num
+        for metric in self.METRICS:
+            setattr(self, metric, getattr(record, metric) or 0.0)
+        self.hosttime = record.hosttime and epoch(record.hosttime) or 0.0
+        self.net_timestamp = record.net_timestamp and \
+            epoch(record.net_timestamp) or 0.0
+        self.distributions = {}
+        for name in self.DISTRIBUTIONS:
+            perc = getattr(record, name + '_perc')
+            if perc:
+                self.distributions[name] = Distribution(
+                    getattr(record, name + '_lo'), perc[0], perc[1],
+                    getattr(record, name + '_hi'))
+
+    def rate(self, prev, metric, timestamp):
+        if prev is None:
+            return None
+        diff = getattr(self, timestamp) - getattr(prev, timestamp)
+        if diff <= 0:
+            return None
+        return (getattr(self, metric) - getattr(prev, metric)) / diff
@@ -0,0 +1,285 @@
+# vi: set encoding=utf-8
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+
+import math
+from collections import deque
+from typing import NamedTuple
+
+
+class Distribution(NamedTuple):
+    min: float
+    median: float
+    p90: float
+    max: float
+
+
+def quantile(ordered, q):
+    """
+    Return the ``q`` quantile of the sorted sequence ``ordered`` using linear
+    interpolation between the closest ranks.
+    """
+    pos = (len(ordered) - 1) * q
+    lo = int(pos)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (pos - lo)
+
+
+def distribution(values):
+    if not len(values):
+        return None
+    ordered = sorted(values)
+    return Distribution(ordered[0],
+                        quantile(ordered, 0.5),
+                        quantile(ordered, 0.9),
+                        ordered[-1])
+
+
+def ratios(current, total):
+    return [c / t if t > 0 else 0.0 for c, t in zip(current, total)]
+
+
+def outliers(values, median, deviation):
+    """
+    Return the indexes of all values that deviate more than ``deviation``
+    from ``median``.
+    """
+    lower, upper = median - deviation, median + deviation
+    return [idx for idx, v in enumerate(values) if v < lower or v > upper]
+
+
+class HeapTracker:
+    """
+    Keeps a bounded history of the heap usage of each node and infers
+    garbage collections from decreasing heap usage between two probes.
+
+    ``sys.nodes`` does not expose per collector statistics, so collections
+    are counted per node and the reclaimed bytes are the sum of the drops.
+    """
+
+    def __init__(self, size=60, window=60.0):
+        self.size = size
+        self.window = window
+        self.history = {}
+        self.collections = {}
+        self.last = {}
+
+    def update(self, nodes):
+        for node_id, used, total, ts in zip(nodes.ids, nodes.heap_used,
+                                            nodes.heap_max, nodes.heap_timestamp):
+            if node_id not in self.history:
+                self.history[node_id] = deque(maxlen=self.size)
+                self.collections[node_id] = deque()
+            last = self.last.get(node_id)
+            if last is None or ts > last[1]:
+                if last is not None and used < last[0]:
+                    self.collections[node_id].append((ts, last[0] - used))
+                self.history[node_id].append(total > 0 and used / total or 0.0)
+                self.last[node_id] = (used, ts)
+            events = self.collections[node_id]
+            while events and events[0][0] < ts - self.window:
+                events.popleft()
+        if len(self.history) > len(nodes):
+            for node_id in [n for n in self.history if n not in nodes.index]:
+                del self.history[node_id]
+                del self.collections[node_id]
+                del self.last[node_id]
+
+    def gc_rates(self, node_id):
+        """
+        Return collections per second and reclaimed bytes per second of a
+        node within the tracking window.
+        """
+        events = self.collections.get(node_id)
+        if not events:
+            return 0.0, 0.0
+        return (len(events) / self.window,
+                sum(freed for ts, freed in events) / self.window)
+
+
+class OnlineRegression:
+    """
+    Exponentially weighted least squares fit of ``y`` over ``x``.
+
+    Only the weighted sums are kept, so adding a sample is O(1) and no
+    history is stored. Samples lose half of their weight every ``halflife``
+    units of ``x``. The sums are kept relative to the latest ``x`` to avoid
+    loss of precision with large timestamps.
+    """
+
+    __slots__ = ('decay', 'x', 'n', 'sw', 'sx', 'sy', 'sxx', 'sxy')
+
+    def __init__(self, halflife):
+        self.decay = math.log(2) / halflife
+        self.x = None
+        self.n = 0
+        self.sw = self.sx = self.sy = self.sxx = self.sxy = 0.0
+
+    def add(self, x, y):
+        if self.x is not None:
+            d = x - self.x
+            if d <= 0:
+                return
+            w = math.exp(-self.decay * d)
+            # shift the origin to the new sample, then decay the old weights
+            self.sxx = w * (self.sxx - 2 * d * self.sx + d * d * self.sw)
+            self.sxy = w * (self.sxy - d * self.sy)
+            self.sx = w * (self.sx - d * self.sw)
+            self.sy = w * self.sy
+            self.sw = w * self.sw
+        self.x = x
+        self.n += 1
+        self.sw += 1.0
+        self.sy += y
+
+    @property
+    def slope(self):
+        """
+        Change of ``y`` per unit of ``x``, ``None`` before two samples
+        were added.
+        """
+        denom = self.sw * self.sxx - self.sx * self.sx
+        if self.n < 2 or denom <= 0:
+            return None
+        return (self.sw * self.sxy - self.sx * self.sy) / denom
+
+
+class Forecaster:
+    """
+    Fits the usage of a resource of every node over time and estimates when
+    it reaches its capacity.
+    """
+
+    def __init__(self, halflife=900.0, min_samples=5):
+        self.halflife = halflife
+        self.min_samples = min_samples
+        self.fits = {}
+
+    def update(self, ids, used, timestamps):
+        fits = self.fits
+        for node_id, u, ts in zip(ids, used, timestamps):
+            fit = fits.get(node_id)
+            if fit is None:
+                fit = fits[node_id] = OnlineRegression(self.halflife)
+            fit.add(ts, u)
+        if len(fits) > len(ids):
+            current = set(ids)
+            for node_id in [n for n in fits if n not in current]:
+                del fits[node_id]
+
+    def trend(self, node_id):
+        """
+        Return the change of usage per second of a node, ``None`` if
+        unknown.
+        """
+        fit = self.fits.get(node_id)
+        if fit is None or fit.n < self.min_samples:
+            return None
+        return fit.slope
+
+    def eta(self, node_id, used, total):
+        """
+        Return the seconds until the usage of a node reaches ``total``,
+        ``None`` if usage is not growing.
+        """
+        slope = self.trend(node_id)
+        if slope is None or slope <= 0:
+            return None
+        return max(0.0, total - used) / slope
+
+
+# resolution of the latency histogram of JOB_BUCKETS_QUERY
+BUCKETS_PER_OCTAVE = 4
+
+
+class JobAggregate(NamedTuple):
+    label: str
+    count: int
+    min: float
+    avg: float
+    max: float
+    median: float
+    perc95: float
+    perc99: float
+
+
+def histogram_quantile(histogram, count, q, lo, hi):
+    """
+    Estimate the ``q`` quantile from a histogram ``{bucket: count}`` of
+    durations, where bucket ``b`` holds durations ``d`` with
+    ``b <= log2(d + 1) * BUCKETS_PER_OCTAVE < b + 1``, interpolating within
+    the bucket.
+    """
+    target = q * count
+    seen = 0
+    for bucket in sorted(histogram):
+        n = histogram[bucket]
+        if seen + n >= target:
+            lower = 2 ** (bucket / BUCKETS_PER_OCTAVE) - 1
+            upper = 2 ** ((bucket + 1) / BUCKETS_PER_OCTAVE) - 1
+            value = lower + (upper - lower) * (target - seen) / n
+            return min(max(value, lo), hi)
+        seen += n
+    return hi
+
+
+class JobBuckets:
+    """
+    Latency histograms of ``sys.jobs_log`` per user and coordinating node,
+    which can be pivoted by either of them without querying the cluster
+    again. Pivots are computed once per result.
+    """
+
+    PIVOTS = ('username', 'node')
+
+    def __init__(self, records):
+        self.records = records
+        self.pivots = {}
+
+    def pivot(self, field):
+        """
+        Return a ``JobAggregate`` per value of ``field``, most frequent
+        first.
+        """
+        rows = self.pivots.get(field)
+        if rows is not None:
+            return rows
+        groups = {}
+        for r in self.records:
+            key = getattr(r, field) or '-'
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = [0, 0.0, r.min, r.max, {}]
+            group[0] += r.count
+            group[1] += r.total
+            group[2] = min(group[2], r.min)
+            group[3] = max(group[3], r.max)
+            bucket = int(r.bucket)
+            group[4][bucket] = group[4].get(bucket, 0) + r.count
+        rows = []
+        for key, (count, total, lo, hi, histogram) in groups.items():
+            rows.append(JobAggregate(
+                key, count, lo, count and total / count or 0.0, hi,
+                histogram_quantile(histogram, count, 0.5, lo, hi),
+                histogram_quantile(histogram, count, 0.95, lo, hi),
+                histogram_quantile(histogram, count, 0.99, lo, hi)))
+        rows.sort(key=lambda row: -row.count)
+        self.pivots[field] = rows
+        return rows
@@ -0,0 +1,224 @@
+# vi: set encoding=utf-8
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+"""
+HTTP transport which sends statements to the ``_sql`` endpoint of CrateDB.
+
+``HttpPool`` mimics the parts of an aiopg pool that are used by
+``exec_query``, so that results have the same shape regardless of the
+transport.
+"""
+
+import json
+import base64
+import asyncio
+from collections import namedtuple
+from .log import get_logger
+
+logger = get_logger(__name__)
+
+Column = namedtuple('Column', ['name'])
+
+
+class SQLError(Exception):
+    pass
+
+
+class HttpCursor:
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.description = None
+        self.rowcount = -1
+        self.rows = []
+
+    async def execute(self, stmt, params=None):
+        payload = {'stmt': stmt}
+        if params:
+            # CrateDB uses ? placeholders, only convert if there are
+            # parameters since statements may contain a literal %s
+            payload['stmt'] = stmt.replace('%s', '?')
+            payload['args'] = list(params)
+        result = await self.conn.request(payload)
+        self.description = [Column(name) for name in result.get('cols', [])]
+        self.rows = result.get('rows', [])
+        self.rowcount = result.get('rowcount', len(self.rows))
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+
+class HttpConnection:
+    """
+    A keep-alive HTTP/1.1 connection which is opened on first use and
+    re-opened if the server closed it.
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.reader = None
+        self.writer = None
+        self.closed = False
+
+    def cursor(self):
+        return HttpCursor(self)
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(
+            self.pool.host, self.pool.port, ssl=self.pool.ssl)
+
+    async def request(self, payload):
+        body = json.dumps(payload).encode('utf-8')
+        reused = self.writer is not None and not self.reader.at_eof()
+        if not reused:
+            self.disconnect()
+            await self.connect()
+        try:
+            status, headers, data = await self.send(body)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            if not reused:
+                raise
+            # the server closed the idle connection, retry once on a new one
+            logger.debug('keep-alive connection closed, reconnecting')
+            self.disconnect()
+            await self.connect()
+            status, headers, data = await self.send(body)
+        if headers.get('connection', '').lower() == 'close':
+            self.close()
+        try:
+            result = json.loads(data.decode('utf-8'))
+        except ValueError:
+            raise SQLError('HTTP {0}: invalid response'.format(status))
+        if status != 200 or 'error' in result:
+            error = result.get('error', {})
+            raise SQLError(error.get('message') or 'HTTP {0}'.format(status))
+        return result
+
+    async def send(self, body):
+        headers = [
+            'POST /_sql HTTP/1.1',
+            'Host: {0}:{1}'.format(self.pool.host, self.pool.port),
+            'Content-Type: application/json',
+            'Content-Length: {0}'.format(len(body)),
+            'Connection: keep-alive',
+        ]
+        if self.pool.auth is not None:
+            headers.append('Authorization: Basic {0}'.format(self.pool.auth))
+        self.writer.write('\r\n'.join(headers).encode('latin-1') +
+                          b'\r\n\r\n' + body)
+        await self.writer.drain()
+        return await self.read_response()
+
+    async def read_response(self):
+        line = await self.reader.readline()
+        if not line:
+            raise ConnectionError('connection closed by server')
+        status = int(line.split()[1])
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    await self.reader.readline()
+                    break
+                chunks.append(await self.reader.readexactly(size))
+                await self.reader.readline()
+            return status, headers, b''.join(chunks)
+        length = int(headers.get('content-length', 0))
+        return status, headers, await self.reader.readexactly(length)
+
+    def disconnect(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+            self.reader = None
+
+    def close(self):
+        self.closed = True
+        self.disconnect()
+
+
+class _Acquire:
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.conn = None
+
+    async def __aenter__(self):
+        self.conn = self.pool.get()
+        return self.conn
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            # the response may not have been read completely
+            self.conn.close()
+        self.pool.release(self.conn)
+
+
+class HttpPool:
+    """
+    Pool of keep-alive connections to the ``_sql`` endpoint. At most
+    ``maxsize`` idle connections are kept for reuse, which covers the
+    queries of a refresh that run concurrently, so that no connections are
+    opened once the pool is warm.
+    """
+
+    def __init__(self, host, port, user=None, password=None, ssl=False,
+                 maxsize=16):
+        self.host = host
+        self.port = port
+        self.ssl = ssl or None
+        self.auth = None
+        if user is not None:
+            credentials = '{0}:{1}'.format(user, password or '')
+            self.auth = base64.b64encode(credentials.encode('utf-8')).decode('ascii')
+        self.maxsize = maxsize
+        self.idle = []
+
+    def acquire(self):
+        return _Acquire(self)
+
+    def get(self):
+        return self.idle and self.idle.pop() or HttpConnection(self)
+
+    def release(self, conn):
+        if not conn.closed and len(self.idle) < self.maxsize:
+            self.idle.append(conn)
+
+    def terminate(self):
+        for conn in self.idle:
+            conn.close()
+        self.idle = []
+
+    def __repr__(self):
+        return '<HttpPool {0}:{1}>'.format(self.host, self.port)
@@ -11,3 +11,20 @@ def byte_size(value, suffix='b', k=1024):
         value /= k
     return '{0:.1f}{1}{2}'.format(value, unit, suffix)
 
+
+def duration(seconds):
+    """
+    Format a number of seconds with the two most significant units, e.g.
+    ``2h05m``.
+    """
+    seconds = int(seconds)
+    if seconds < 60:
+        return '{0}s'.format(seconds)
+    minutes, seconds = divmod(seconds, 60)
+    if minutes < 60:
+        return '{0}m{1:02d}s'.format(minutes, seconds)
+    hours, minutes = divmod(minutes, 60)
+    if hours < 24:
+        return '{0}h{1:02d}m'.format(hours, minutes)
+    days, hours = divmod(hours, 24)
+    return '{0}d{1:02d}h'.format(days, hours)
@@ -19,8 +19,10 @@
 # software solely pursuant to the terms of the relevant commercial agreement.
 
 import urwid
+import logging
 from datetime import datetime
-from .utils import byte_size
+from .utils import byte_size, duration
+from .stats import distribution, outliers, ratios
 from .log import get_logger
 
 logger = get_logger(__name__)
@@ -95,18 +97,108 @@ class HorizontalBytesBar(HorizontalBar):
         return '{}/{}'.format(byte_size(self.current), byte_size(self.total))
 
 
+class HorizontalValueBar(HorizontalBar):
+
+    def progress_text(self):
+        return '{0:.1f}'.format(self.current)
+
+
+class DistributionText(urwid.Text):
+    """
+    Shows min, median, p90 and max of the per node utilization and flags the
+    nodes that deviate more than ``deviation`` from the median.
+    """
+
+    MAX_OUTLIERS = 3
+
+    def __init__(self, deviation=0.2):
+        self.deviation = deviation
+        super().__init__('', wrap='clip')
+
+    def set_data(self, current, total, labels):
+        values = ratios(current, total)
+        dist = distribution(values)
+        if dist is None:
+            self.set_text('')
+            return
+        flagged = outliers(values, dist.median, self.deviation)
+        flagged.sort(key=lambda idx: -abs(values[idx] - dist.median))
+        self.set_distribution(dist, [(labels[idx], values[idx])
+                                     for idx in flagged])
+
+    def set_distribution(self, dist, flagged=[]):
+        """
+        :param dist: ``Distribution`` of the per node ratios
+        :param flagged: list of ``(label, ratio)`` of outlier nodes
+        """
+        if dist is None:
+            self.set_text('')
+            return
+        text = [('default', ' ' * 10 + 'min {0:.1%}  med {1:.1%}  '
+                 'p90 {2:.1%}  max {3:.1%}'.format(*dist))]
+        for label, value in flagged[:self.MAX_OUTLIERS]:
+            arrow = value > dist.median and '\u25b2' or '\u25bc'
+            text.append(('text_red', '  {0} {1} {2:.1%}'.format(
+                arrow, label, value)))
+        if len(flagged) > self.MAX_OUTLIERS:
+            text.append(('text_red', '  +{0}'.format(
+                len(flagged) - self.MAX_OUTLIERS)))
+        self.set_text(text)
+
+
+class ForecastText(urwid.Text):
+    """
+    Shows the estimated time until the nodes closest to full reach their
+    capacity.
+    """
+
+    MAX_NODES = 3
+
+    def __init__(self):
+        super().__init__('', wrap='clip')
+
+    def set_data(self, etas):
+        """
+        :param etas: list of ``(label, seconds)`` sorted by ``seconds``
+        """
+        if not etas:
+            self.set_text('')
+            return
+        text = [('default', ' ' * 10 + 'full in')]
+        for label, eta in etas[:self.MAX_NODES]:
+            attr = eta < 3600 and 'text_red' or \
+                eta < 86400 and 'text_yellow' or 'default'
+            text.append((attr, '  {0} {1}'.format(label, duration(eta))))
+        if len(etas) > self.MAX_NODES:
+            text.append(('default', '  +{0}'.format(
+                len(etas) - self.MAX_NODES)))
+        self.set_text(text)
+
+
 class MultiBarWidget(urwid.Pile):
 
-    def __init__(self, title, bar_cls=HorizontalPercentBar, **bar_options):
+    def __init__(self, title, bar_cls=HorizontalPercentBar, deviation=None,
+                 forecast=False, **bar_options):
         self.title = title
         self.bar_cls = bar_cls
         self.bar = bar_cls('', **bar_options)
         self.details = urwid.Pile([])
-        widgets = [
-            self.bar,
-            self.details,
-        ]
-        self._history = []
+        self.groups = urwid.Pile([])
+        widgets = [self.bar]
+        self.distribution = None
+        if deviation is not None:
+            self.distribution = DistributionText(deviation)
+            widgets.append(self.distribution)
+        self.forecast = None
+        if forecast:
+            self.forecast = ForecastText()
+            widgets.append(self.forecast)
+        widgets.append(self.groups)
+        widgets.append(self.details)
+        self._current = []
+        self._total = []
+        self._labels = []
+        self._group_labels = []
         super().__init__(widgets)
 
     def toggle_details(self):
@@ -117,25 +209,70 @@ class MultiBarWidget(urwid.Pile):
 
     def append_node_bars(self):
         bars = []
-        for value in self._history:
-            bar = self.bar_cls(value[2], value[0], value[1],
-                               symbol=HorizontalBar.SINGLE)
+        for label in self._labels:
+            bar = self.bar_cls(label, symbol=HorizontalBar.SINGLE)
             bars.append((bar, ('pack', None)))
         self.details.contents = bars
+        self.update_node_bars()
         return len(bars)
 
-    def sum(self, values=[]):
-        logger.debug('%s', [sum([x[0] for x in values]), sum([x[1] for x in values])])
-        return (sum([x[0] for x in values]), sum([x[1] for x in values]))
+    def update_node_bars(self):
+        for widget, value in zip(self.details.contents,
+                                 zip(self._current, self._total)):
+            widget[0].set_progress(*value)
 
-    def set_data(self, values=[]):
-        self._history = values
-        self.bar.set_progress(*self.sum(values))
-        if len(self.details.contents) and \
-                self.append_node_bars():
-            for idx, widget in enumerate(self.details.contents):
-                bar = widget[0]
-                bar.set_progress(*values[idx][:2])
+    def sum(self):
+        total = (sum(self._current), sum(self._total))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('%s sum: %s', self.title, total)
+        return total
+
+    def set_data(self, current, total, labels):
+        """
+        :param current: column of current values, one per node
+        :param total: column of maximum values, one per node
+        :param labels: list of node names
+        """
+        self._current = current
+        self._total = total
+        relabel = labels != self._labels
+        self._labels = labels
+        self.bar.set_progress(*self.sum())
+        if self.distribution is not None:
+            self.distribution.set_data(current, total, labels)
+        if len(self.details.contents):
+            if relabel:
+                self.append_node_bars()
+            else:
+                self.update_node_bars()
+
+    def group_bar(self, label):
+        return self.bar_cls(label)
+
+    def set_groups(self, current, total, labels):
+        """
+        Show one aggregate bar per node group between the cluster total and
+        the per node bars.
+        """
+        if labels != self._group_labels:
+            self._group_labels = labels
+            self.groups.contents = [(self.group_bar(label), ('pack', None))
+                                    for label in labels]
+        for (bar, _), value in zip(self.groups.contents, zip(current, total)):
+            bar.set_progress(*value)
+
+    def set_forecast(self, etas):
+        if self.forecast is not None:
+            self.forecast.set_data(etas)
+
+    def set_summary(self, current, total, dist=None):
+        """
+        Update the aggregate bar from cluster wide totals, without per node
+        values.
+        """
+        self.bar.set_progress(current, total)
+        if self.distribution is not None:
+            self.distribution.set_distribution(dist)
 
 
 class IOBar(BarWidgetBase):
@@ -196,45 +333,276 @@ class IOStatWidget(MultiBarWidget):
 
     def append_node_bars(self):
         bars = []
-        for ts, packets, name in self._history:
-            bar = self.bar_cls(name, suffix=self.suffix)
+        for label in self._labels:
+            bar = self.bar_cls(label, suffix=self.suffix)
             bars.append((bar, ('pack', None)))
         self.details.contents = bars
+        self.update_node_bars()
         return len(bars)
 
-    def sum(self, values=[]):
-        tx_total = 0.0
-        rx_total = 0.0
-        if len(self._history):
-            for idx, value in enumerate(values):
-                if self._history[idx][0] < values[idx][0]:
-                    tx, rx = self._calculate(values[idx], self._history[idx])
-                    tx_total += tx
-                    rx_total += rx
-        return tx_total, rx_total
-
-    def set_data(self, values=[]):
-        """
-        :param values: a list of [timestamp, {'tx': ..., 'rx': ...}, node_name]
-        """
-        if len(self._history) and \
-                len(self.details.contents) and \
-                self.append_node_bars():
-            for idx, widget in enumerate(self.details.contents):
-                bar = widget[0]
-                if self._history[idx][0] >= values[idx][0]:
-                    tx, rx = bar.tx, bar.rx
-                else:
-                    tx, rx = self._calculate(values[idx], self._history[idx])
-                bar.set_progress(tx, rx)
-        self.bar.set_progress(*self.sum(values))
-        self._history = values
-
-    def _calculate(self, value, last_value):
-        prev_timestamp, prev_values, prev_name = last_value
-        timestamp, values, name = value
-        assert prev_name == name
-        diff = (timestamp - prev_timestamp).total_seconds()
-        tx = (values['tx'] - prev_values['tx']) / diff
-        rx = (values['rx'] - prev_values['rx']) / diff
-        return tx, rx
+    def update_node_bars(self):
+        for widget, tx, rx in zip(self.details.contents,
+                                  self._current, self._total):
+            bar = widget[0]
+            # keep the last known rate if it could not be calculated
+            bar.set_progress(bar.tx if tx is None else tx,
+                             bar.rx if rx is None else rx)
+
+    def sum(self):
+        return (sum(x for x in self._current if x is not None),
+                sum(x for x in self._total if x is not None))
+
+    def set_data(self, tx, rx, labels):
+        """
+        :param tx: list of outbound rates per node, ``None`` if unknown
+        :param rx: list of inbound rates per node, ``None`` if unknown
+        :param labels: list of node names
+        """
+        super().set_data(tx, rx, labels)
+
+    def group_bar(self, label):
+        return self.bar_cls(label, suffix=self.suffix)
+
+    def set_summary(self, tx, rx, dist=None):
+        self.bar.set_progress(self.bar.tx if tx is None else tx,
+                              self.bar.rx if rx is None else rx)
+
+
+class DeviceStatWidget(urwid.Pile):
+    """
+    Table of disk usage, throughput and operations per second of every data
+    disk of every node.
+    """
+
+    COLUMNS = ('used', 'read', 'write', 'r/s', 'w/s')
+
+    def __init__(self):
+        self._labels = []
+        super().__init__([self._row('device', *self.COLUMNS, attr='head')])
+
+    def _row(self, label, *values, attr=None):
+        return urwid.AttrMap(urwid.Columns(
+            [urwid.Text(label, wrap='clip')] +
+            [(11, urwid.Text(v, align='right')) for v in values],
+            dividechars=1), attr)
+
+    def _rate(self, value, suffix):
+        if value is None or value < 0:
+            return '-'
+        return byte_size(value, suffix=suffix, k=1000)
+
+    def set_data(self, labels, used, size, bytes_read, bytes_written,
+                 reads, writes):
+        if labels != self._labels:
+            self._labels = labels
+            self.contents[1:] = [(self._row(label, *[''] * len(self.COLUMNS)),
+                                  ('pack', None)) for label in labels]
+        rows = zip(self.contents[1:], used, size, bytes_read, bytes_written,
+                   reads, writes)
+        for (row, _), u, s, br, bw, r, w in rows:
+            values = [
+                s > 0 and '{0:.1%}'.format(u / s) or '-',
+                self._rate(br, 'b/s'),
+                self._rate(bw, 'b/s'),
+                self._rate(r, '/s'),
+                self._rate(w, '/s'),
+            ]
+            for (text, _), value in zip(row.original_widget.contents[1:], values):
+                text.set_text(value)
+
+
+class TableStatWidget(urwid.Pile):
+    """
+    Table of the document count, size, and ingest rates of the busiest
+    tables and partitions.
+    """
+
+    COLUMNS = ('docs', 'size', 'docs/s', 'bytes/s')
+    MAX_ROWS = 20
+
+    def __init__(self):
+        super().__init__([self._row('table', *self.COLUMNS, attr='head')])
+
+    def _row(self, label, *values, attr=None):
+        return urwid.AttrMap(urwid.Columns(
+            [urwid.Text(label, wrap='clip')] +
+            [(11, urwid.Text(v, align='right')) for v in values],
+            dividechars=1), attr)
+
+    def _rate(self, value, suffix):
+        if value is None:
+            return '-'
+        return byte_size(value, suffix=suffix, k=1000)
+
+    def set_data(self, labels, docs, size, docs_rate, bytes_rate):
+        """
+        :param labels: table names, sorted by how busy the table is
+        :param docs: per table document count
+        :param size: per table size in bytes
+        :param docs_rate: per table documents per second, ``None`` if unknown
+        :param bytes_rate: per table bytes per second, ``None`` if unknown
+        """
+        rows = list(zip(labels, docs, size, docs_rate,
+                        bytes_rate))[:self.MAX_ROWS]
+        self.contents[1:] = [(self._row(
+            label,
+            byte_size(d, suffix='', k=1000),
+            byte_size(s, suffix='b'),
+            self._rate(dr, '/s'),
+            self._rate(br, 'b/s'),
+        ), ('pack', None)) for label, d, s, dr, br in rows]
+
+
+class ChecksWidget(urwid.Pile):
+    """
+    List of the failing cluster and node checks, most severe first.
+    """
+
+    SEVERITIES = {
+        1: ('LOW', 'text_green'),
+        2: ('MEDIUM', 'text_yellow'),
+        3: ('HIGH', 'text_red'),
+    }
+
+    def __init__(self):
+        super().__init__([])
+
+    def _row(self, severity, description, nodes):
+        label, attr = self.SEVERITIES.get(severity, ('?', 'default'))
+        text = [(attr, '{0:<7}'.format(label)), ('default', description)]
+        if nodes is not None:
+            text.append(('default', ' ({0} nodes)'.format(nodes)))
+        return urwid.Text(text)
+
+    def set_data(self, checks):
+        """
+        :param checks: list of ``(severity, description, nodes)``, where
+                       ``nodes`` is ``None`` for cluster checks
+        """
+        self.contents[:] = [(self._row(*check), ('pack', None))
+                            for check in checks]
+
+
+class Sparkline(urwid.Text):
+
+    TICKS = '\u2581\u2582\u2583\u2584\u2585\u2586\u2587\u2588'
+
+    def __init__(self, attr='text_green'):
+        self.attr = attr
+        super().__init__('', wrap='clip')
+
+    def set_data(self, values):
+        """
+        :param values: sequence of values between 0.0 and 1.0
+        """
+        top = len(self.TICKS) - 1
+        self.set_text((self.attr, ''.join(
+            self.TICKS[max(0, min(top, round(v * top)))] for v in values)))
+
+
+class HeapStatWidget(urwid.Pile):
+    """
+    Table of heap usage over time and inferred garbage collection activity
+    of every node.
+    """
+
+    def __init__(self, width=30):
+        self.width = width
+        self._labels = []
+        super().__init__([self._row('node', urwid.Text('heap history'),
+                                    'used', 'trend', 'gc/min', 'freed',
+                                    attr='head')])
+
+    def _row(self, label, history, *values, attr=None):
+        return urwid.AttrMap(urwid.Columns(
+            [(16, urwid.Text(label, wrap='clip')), (self.width, history)] +
+            [(9, urwid.Text(v, align='right')) for v in values],
+            dividechars=1), attr)
+
+    def _trend(self, value):
+        if value is None:
+            return '-'
+        return '{0:+.1%}/m'.format(value * 60)
+
+    def set_data(self, labels, history, used, trends, collections, freed):
+        """
+        :param labels: node names
+        :param history: per node sequence of heap usage ratios
+        :param used: per node current heap usage ratio
+        :param trends: per node change of heap usage ratio per second,
+                       ``None`` if unknown
+        :param collections: per node collections per second
+        :param freed: per node reclaimed bytes per second
+        """
+        if labels != self._labels:
+            self._labels = labels
+            self.contents[1:] = [
+                (self._row(label, Sparkline(), '', '', '', ''), ('pack', None))
+                for label in labels
+            ]
+        rows = zip(self.contents[1:], history, used, trends, collections, freed)
+        for (row, _), h, u, t, c, f in rows:
+            cols = row.original_widget.contents
+            cols[1][0].set_data(list(h)[-self.width:])
+            cols[2][0].set_text('{0:.1%}'.format(u))
+            cols[3][0].set_text(self._trend(t))
+            cols[4][0].set_text('{0:.1f}'.format(c * 60))
+            cols[5][0].set_text(byte_size(f, suffix='b/s'))
+
+
+class PanelWidget(urwid.Pile):
+    """
+    Shows the result of a user defined query as a table, as one bar per row
+    or as a sparkline.
+    """
+
+    def __init__(self, render, width=60):
+        self.width = width
+        self._columns = ()
+        self._labels = []
+        self.sparkline = Sparkline()
+        self.current = urwid.Text('-', align='right')
+        widgets = []
+        if render == 'sparkline':
+            widgets.append(urwid.Columns([
+                (width, self.sparkline), (12, self.current)], dividechars=1))
+        super().__init__(widgets)
+
+    def _row(self, values, attr=None):
+        return urwid.AttrMap(urwid.Columns(
+            [urwid.Text(str(v), wrap='clip') for v in values],
+            dividechars=1), attr)
+
+    def set_table(self, columns, rows):
+        if columns != self._columns:
+            self._columns = columns
+            self.contents[:] = [(self._row(columns, attr='head'),
+                                 ('pack', None))]
+        self.contents[1:] = [(self._row(row), ('pack', None)) for row in rows]
+
+    def set_bars(self, labels, values, maximum=None):
+        """
+        :param labels: one label per bar
+        :param values: one value per bar, ``None`` if unknown
+        :param maximum: value of a full bar, the largest value if ``None``
+        """
+        if labels != self._labels:
+            self._labels = labels
+            self.contents[:] = [(HorizontalValueBar(label, symbol=HorizontalBar.SINGLE),
+                                 ('pack', None)) for label in labels]
+        known = [v for v in values if v is not None]
+        if maximum is None:
+            maximum = known and max(known) or 0.0
+        for (bar, _), value in zip(self.contents, values):
+            bar.set_progress(value or 0.0, maximum)
+
+    def set_history(self, history, current):
+        """
+        :param history: sequence of values, the latest last
+        :param current: the latest value, ``None`` if unknown
+        """
+        values = list(history)[-self.width:]
+        top = values and max(values) or 0.0
+        self.sparkline.set_data([top > 0 and v / top or 0.0 for v in values])
+        self.current.set_text(current is None and '-' or
+                              '{0:.1f}'.format(current))
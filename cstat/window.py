@@ -20,14 +20,29 @@
 
 
 import re
+import time
 import urwid
+import asyncio
+from datetime import datetime
 from functools import reduce
 from .widgets import (
     MultiBarWidget,
     HorizontalPercentBar,
     HorizontalBytesBar,
     IOStatWidget,
+    DeviceStatWidget,
+    TableStatWidget,
+    ChecksWidget,
+    HeapStatWidget,
+    PanelWidget,
 )
+from .connector import Plan
+from .snapshot import (
+    NodeSnapshot, VitalsSnapshot, DeviceSnapshot, TableSnapshot,
+    ClusterSummary)
+from .stats import Forecaster, HeapTracker, JobBuckets, ratios
+from .history import History
+from .events import EventLog, RESTARTED, node_events
 from .log import get_logger
 
 logger = get_logger(__name__)
@@ -35,6 +50,13 @@ logger = get_logger(__name__)
 RE_PADDING = re.compile('^(\s*)(.*[^\s])(\s*)$')
 UNDEFINED = [('text_red', '-')]
 
+# greys out all colors of a widget that displays outdated data
+STALE_MAP = {attr: 'stale' for attr in (
+    None, 'default', 'headline', 'head', 'tx', 'rx',
+    'text_green', 'text_yellow', 'text_red',
+    'bg_green', 'bg_yellow', 'bg_red',
+)}
+
 
 def padded_text(text):
     return re.sub(RE_PADDING, r' \2 ', text)
@@ -48,9 +70,13 @@ class Tab(urwid.WidgetWrap):
 
     def __init__(self, widgets, title, color):
         self.title = title
+        self.color = color
         self.content = urwid.Pile(widgets)
         super().__init__(urwid.AttrMap(self.content, color))
 
+    def set_stale(self, stale):
+        self._w.set_attr_map(stale and STALE_MAP or {None: self.color})
+
 
 class Menu(urwid.Columns):
 
@@ -110,21 +136,79 @@ class MenuItem:
 
 class MainWindow(urwid.WidgetWrap):
 
-    def __init__(self, controller):
+    PIVOT_LABELS = {
+        'stmt': 'statement',
+        'username': 'user',
+        'node': 'node',
+    }
+
+    # frames replayed per iteration of the event loop when resuming
+    REPLAY_STEP = 10
+
+    def __init__(self, controller, deviation=0.2, groups=None, panels=(),
+                 history_bytes=16 * 1024 * 1024):
         self.controller = controller
+        self.deviation = deviation
+        self.groups = groups
+        self.panels = panels
+        self.history = History(history_bytes)
+        # sequence number of the last live frame while paused
+        self.frozen = None
+        # sequence number of the displayed frame while paused
+        self.shown = None
+        self.live = None
+        # timestamp of the frame that is currently replayed
+        self.replaying = None
+        # sequence number of the last frame replayed after a pause
+        self.resuming = None
+        self.stale = False
+        self.nodes = None
+        # the node data that was last fed into the accumulators
+        self.vitals = None
+        self.devices = None
+        self.tables = None
+        self.summary = None
+        self.checks = {}
+        self.show_details = False
+        self.failures = {}
         self.frame = self.layout()
         super().__init__(self.frame)
 
     def layout(self):
-        self.cpu_widget = MultiBarWidget('CPU')
-        self.process_widget = MultiBarWidget('PROC')
-        self.memory_widget = MultiBarWidget('MEM', bar_cls=HorizontalBytesBar)
-        self.heap_widget = MultiBarWidget('HEAP', bar_cls=HorizontalBytesBar)
-        self.disk_widget = MultiBarWidget('DISK', bar_cls=HorizontalBytesBar)
+        self.cpu_widget = MultiBarWidget('CPU', deviation=self.deviation)
+        self.process_widget = MultiBarWidget('PROC', deviation=self.deviation)
+        self.memory_widget = MultiBarWidget('MEM', bar_cls=HorizontalBytesBar,
+                                            deviation=self.deviation)
+        self.heap_widget = MultiBarWidget('HEAP', bar_cls=HorizontalBytesBar,
+                                          deviation=self.deviation)
+        self.disk_widget = MultiBarWidget('DISK', bar_cls=HorizontalBytesBar,
+                                          deviation=self.deviation,
+                                          forecast=True)
+        self.disk_forecast = Forecaster()
+        self.cluster_forecast = Forecaster()
         self.net_io_widget = IOStatWidget('NET', suffix='p/s')
         self.disk_io_widget = IOStatWidget('DISK', suffix='b/s')
+        self.device_widget = DeviceStatWidget()
+        self.table_widget = TableStatWidget()
+        self.checks_widget = ChecksWidget()
+        self.events = EventLog()
+        self.event_rows = urwid.SimpleFocusListWalker([])
+        self.jvm_widget = HeapStatWidget()
+        self.heap_tracker = HeapTracker()
+        self.heap_forecast = Forecaster(halflife=300.0)
+        self.panel_widgets = {p.query.name: PanelWidget(p.render)
+                              for p in self.panels}
+        self.panel_boxes = {
+            p.query.name: Tab([
+                urwid.LineBox(self.panel_widgets[p.query.name], p.title),
+            ], p.title, 'default') for p in self.panels
+        }
         self.logging_state = urwid.Text([('headline', 'Jobs Logging')])
         self.logs = urwid.SimpleFocusListWalker([])
+        self.jobs = None
+        self.job_buckets = None
+        self.jobs_pivot = 'stmt'
+        self.t_jobs_pivot = urwid.Text('statement')
 
         self.t_cluster_name = urwid.Text(UNDEFINED)
         self.t_version = urwid.Text(UNDEFINED)
@@ -134,6 +218,9 @@ class MainWindow(urwid.WidgetWrap):
         self.t_udc_enabled = urwid.Text(UNDEFINED)
 
         self.t_handler = urwid.Text(UNDEFINED)
+        self.t_alerts = urwid.Text('')
+        self.t_checks = urwid.Text('')
+        self.t_stale = urwid.Text('', align='right')
         self.t_load = urwid.Text('-/-/-', align='right')
 
         self.menu1 = Menu([
@@ -145,7 +232,8 @@ class MainWindow(urwid.WidgetWrap):
             MenuItem('1', 'Utilization'),
             MenuItem('2', 'I/O Stats'),
             MenuItem('3', 'Job Logging'),
-        ], dividechars=1)
+            MenuItem('4', 'JVM'),
+        ] + (self.panels and [MenuItem('5', 'Panels')] or []), dividechars=1)
 
         self.menu3 = Menu([
             #MenuItem('?', 'Help'),
@@ -153,7 +241,11 @@ class MainWindow(urwid.WidgetWrap):
         ], dividechars=1)
 
         menu = urwid.Pile([
-            urwid.AttrMap(urwid.Text('cstat'), 'inverted'),
+            urwid.AttrMap(urwid.Columns([
+                ('pack', urwid.Text('cstat ')),
+                ('pack', self.t_checks),
+                self.t_stale,
+            ]), 'inverted'),
             urwid.AttrMap(urwid.Columns([
                 (self.menu1.width(), self.menu1),
                 (self.menu2.width(), self.menu2),
@@ -168,7 +260,7 @@ class MainWindow(urwid.WidgetWrap):
         ], dividechars=1), 'inverted')
 
         self.tab_1 = Tab([
-            urwid.LineBox(
+            urwid.LineBox(urwid.Pile([
                 urwid.Columns([
                     (12, urwid.Pile([
                         urwid.Text('Cluster'),
@@ -186,8 +278,11 @@ class MainWindow(urwid.WidgetWrap):
                         self.t_enterprise_enabled,
                         self.t_udc_enabled,
                     ]),
-                ]), title='Cluster Info'
-            ),
+                ]),
+                self.checks_widget,
+            ]), title='Cluster Info'),
+            urwid.LineBox(urwid.BoxAdapter(urwid.ListBox(self.event_rows),
+                                           height=4), title='Node Events'),
         ], 'Cluster Info', 'menu')
 
         self.tab_2 = Tab([
@@ -213,12 +308,14 @@ class MainWindow(urwid.WidgetWrap):
                     urwid.LineBox(self.disk_io_widget, 'Disk I/O'),
                 ]),
             ], dividechars=1),
+            urwid.LineBox(self.device_widget, 'Data Disks'),
+            urwid.LineBox(self.table_widget, 'Table Throughput'),
         ], 'I/O Stats', 'default')
 
         self.tab_4 = Tab([
             self.logging_state,
             urwid.AttrMap(urwid.Columns([
-                urwid.Text('statement'),
+                self.t_jobs_pivot,
                 (7, urwid.Text('count', align='right')),
                 (7, urwid.Text('min', align='right')),
                 (7, urwid.Text('mean', align='right')),
@@ -230,9 +327,17 @@ class MainWindow(urwid.WidgetWrap):
             urwid.BoxAdapter(urwid.ListBox(self.logs), height=10),
         ], 'Jobs Logging', 'default')
 
+        self.tab_5 = Tab([
+            urwid.LineBox(self.jvm_widget, 'Heap and GC Activity'),
+        ], 'JVM', 'default')
+
+        self.tab_6 = Tab([self.panel_boxes[p.query.name] for p in self.panels],
+                         'Panels', 'default')
+
         self.tab_holder = urwid.WidgetPlaceholder(EmptyWidget())
         self.tab_header = urwid.WidgetPlaceholder(self.tab_1)
         body = urwid.Pile([
+            self.t_alerts,
             self.tab_header,
             self.tab_holder,
         ])
@@ -240,13 +345,114 @@ class MainWindow(urwid.WidgetWrap):
         return urwid.Frame(urwid.Filler(body, valign='top'),
                            header=menu, footer=footer)
 
-    def update(self, **kwargs):
+    def set_stale(self, timestamp):
+        """
+        Mark the displayed data as restored from a snapshot taken at
+        ``timestamp`` until the first live update arrives.
+        """
+        self.stale = timestamp
+        self.update_status()
+
+    def clear_stale(self):
+        self.stale = False
+        # rates must not be calculated between snapshot and live data
+        self.nodes = None
+        self.devices = None
+        self.tables = None
+        self.summary = None
+        self.update_status()
+
+    def query_tabs(self, name):
+        return {
+            'nodes': [self.tab_2, self.tab_3, self.tab_5],
+            'summary': [self.tab_2, self.tab_3],
+            'jobs': [self.tab_4],
+            'job_buckets': [self.tab_4],
+            'tables': [self.tab_3],
+            'settings': [self.tab_1],
+            'checks': [self.tab_1],
+            'node_checks': [self.tab_1],
+        }.get(name, name in self.panel_boxes and [self.panel_boxes[name]] or [])
+
+    def set_failure(self, failure):
+        """
+        Keep showing the last good data of a failing query, greyed out and
+        with its age, until the query succeeds again.
+        """
+        self.failures[failure.name] = failure
+        for tab in self.query_tabs(failure.name):
+            tab.set_stale(True)
+        self.update_status()
+
+    def clear_failures(self, names):
+        cleared = [n for n in names if self.failures.pop(n, None)]
+        for name in cleared:
+            for tab in self.query_tabs(name):
+                tab.set_stale(False)
+        if cleared:
+            self.update_status()
+
+    def update_status(self):
+        status = []
+        if self.frozen is not None:
+            position = self.history.position(self.shown)
+            timestamp = self.history.frames[position][1]
+            status.append('paused at {0} ({1}/{2})'.format(
+                datetime.fromtimestamp(timestamp).strftime('%H:%M:%S'),
+                position + 1, len(self.history)))
+        if self.resuming is not None:
+            status.append('resuming')
+        if self.stale:
+            since = datetime.fromtimestamp(self.stale).strftime('%Y-%m-%d %H:%M:%S')
+            status.append('stale snapshot from {0}'.format(since))
+        now = time.time()
+        for name, failure in sorted(self.failures.items()):
+            age = failure.last_success and \
+                '{0:.0f}s old'.format(now - failure.last_success) or 'no data'
+            status.append('{0}: {1} ({2})'.format(name, age, failure.error))
+        self.t_stale.set_text(status and [('bg_red', ' {0} '.format(', '.join(status)))] or '')
+
+    def set_alerts(self, alerts):
+        self.t_alerts.set_text([
+            ('bg_red', ' {0}: {1} ({2:.2f}) '.format(*alert)) for alert in alerts
+        ] or '')
+
+    def update(self, stale=False, **kwargs):
+        if not stale:
+            self.history.append(kwargs)
+            if self.frozen is not None or self.resuming is not None:
+                # keep collecting, the frames are replayed on resume
+                self.update_status()
+                return
+        self.apply(stale, **kwargs)
+
+    def apply(self, stale=False, **kwargs):
+        if self.stale and not stale:
+            self.clear_stale()
+        if not stale:
+            self.clear_failures(kwargs.keys())
+        # the attributes group the nodes of the same refresh
+        if kwargs.get('attributes') and self.groups is not None:
+            self.groups.set_attributes(kwargs.get('attributes'))
         if kwargs.get('nodes'):
             state = kwargs.get('nodes')
             self.update_nodes(state)
+        if kwargs.get('tables') is not None:
+            self.update_tables(kwargs.get('tables'))
+        if kwargs.get('vitals'):
+            self.update_vitals(kwargs.get('vitals'))
+        if kwargs.get('summary'):
+            state = kwargs.get('summary')
+            self.update_summary(state[0])
         if kwargs.get('jobs'):
             state = kwargs.get('jobs')
             self.update_jobs(state)
+        if kwargs.get('job_buckets') is not None:
+            self.job_buckets = JobBuckets(kwargs.get('job_buckets'))
+            self.show_jobs()
+        for name in ('checks', 'node_checks'):
+            if kwargs.get(name) is not None:
+                self.update_checks(name, kwargs.get(name))
         if kwargs.get('settings'):
             state = kwargs.get('settings')
             self.update_settings(state[0])
@@ -256,16 +462,48 @@ class MainWindow(urwid.WidgetWrap):
 
     def update_jobs(self, jobs=[]):
         if jobs is None:
-            self.logs[:] = []
+            self.jobs = None
+            self.job_buckets = None
+            self.show_jobs()
         elif jobs:
-            self.logs[:] = [self._jobs_row('{0}'.format(r.count),
-                                           '{0:.0f}ms'.format(r.min),
-                                           '{0:.0f}ms'.format(r.max),
-                                           '{0:.0f}ms'.format(r.avg),
-                                           '{0:.0f}ms'.format(r.median),
-                                           '{0:.0f}ms'.format(r.perc95),
-                                           '{0:.0f}ms'.format(r.perc99),
-                                           r.stmt) for r in jobs]
+            self.jobs = jobs
+            self.show_jobs()
+
+    def jobs_pivots(self):
+        """
+        The statement view shows the exact percentiles of ``JOBS_QUERY``, the
+        user and node views are approximated from ``JOB_BUCKETS_QUERY``, which
+        requires CrateDB 4.0.
+        """
+        if self.job_buckets is None:
+            return ('stmt', )
+        return ('stmt', ) + JobBuckets.PIVOTS
+
+    def show_jobs(self):
+        pivots = self.jobs_pivots()
+        if self.jobs_pivot not in pivots:
+            self.jobs_pivot = 'stmt'
+        label = self.PIVOT_LABELS[self.jobs_pivot]
+        self.t_jobs_pivot.set_text(
+            len(pivots) > 1 and '{0} (v)'.format(label) or label)
+        if self.jobs_pivot == 'stmt':
+            rows = [(r.stmt, r) for r in self.jobs or ()]
+        else:
+            rows = [(r.label, r) for r in
+                    self.job_buckets.pivot(self.jobs_pivot)]
+        self.logs[:] = [self._jobs_row('{0}'.format(r.count),
+                                       '{0:.0f}ms'.format(r.min),
+                                       '{0:.0f}ms'.format(r.max),
+                                       '{0:.0f}ms'.format(r.avg),
+                                       '{0:.0f}ms'.format(r.median),
+                                       '{0:.0f}ms'.format(r.perc95),
+                                       '{0:.0f}ms'.format(r.perc99),
+                                       label) for label, r in rows]
+
+    def next_jobs_pivot(self):
+        pivots = self.jobs_pivots()
+        self.jobs_pivot = pivots[(pivots.index(self.jobs_pivot) + 1) % len(pivots)]
+        self.show_jobs()
 
     def _jobs_row(self, count, min, max, avg, mean, perc95, perc99, stmt):
         return urwid.Columns([
@@ -293,82 +531,238 @@ class MainWindow(urwid.WidgetWrap):
             self.update_jobs(jobs=None)
 
     def update_nodes(self, data):
-        cpu = []
-        process = []
-        heap = []
-        memory = []
-        disk = []
-        net_io = []
-        disk_io = []
-        load = [0.0, 0.0, 0.0]
-        num = 0
-        for node in data:
-            cpu.append([
-                min(node.cpu_used, 100),
-                100,
-                node.name,
-            ])
-            process.append([
-                node.process['percent'],
-                100.0,
-                node.name,
-            ])
-            heap.append([
-                node.heap['used'],
-                node.heap['max'],
-                node.name,
-            ])
-            memory.append([
-                node.mem['used'],
-                node.mem['free'] + node.mem['used'],
-                node.name,
-            ])
-            disk.append(self.calculate_disk_usage(node.fs) + [node.name])
-            net_io.append([
-                node.net_timestamp,
-                dict(
-                    tx=node.net_packets['sent'],
-                    rx=node.net_packets['received']),
-                node.name,
-            ])
-            disk_io.append([
-                node.hosttime,
-                self.calculate_disk_io(node.fs),
-                node.name,
-            ])
-            for idx, k in enumerate(['1', '5', '15']):
-                load[idx] += node.load[k]
-            num += 1
-        self.memory_widget.set_data(memory)
-        self.heap_widget.set_data(heap)
-        self.cpu_widget.set_data(cpu)
-        self.process_widget.set_data(process)
-        self.disk_widget.set_data(disk)
-        self.net_io_widget.set_data(net_io)
-        self.disk_io_widget.set_data(disk_io)
-        self.t_hosts.set_text(str(num))
+        nodes = NodeSnapshot(data)
+        prev, self.nodes = self.nodes, nodes
+        names = nodes.names
+        if self.replaying is None:
+            self.accumulate_nodes(nodes, time.time())
+        self.cpu_widget.set_data(nodes.cpu_used, [100.0] * len(nodes), names)
+        self.process_widget.set_data(nodes.process, [100.0] * len(nodes), names)
+        self.memory_widget.set_data(nodes.mem_used, nodes.mem_total, names)
+        self.heap_widget.set_data(nodes.heap_used, nodes.heap_max, names)
+        self.update_disk(nodes)
+        rates = (nodes.rates(prev, 'net_tx', 'net_timestamp'),
+                 nodes.rates(prev, 'net_rx', 'net_timestamp'),
+                 nodes.rates(prev, 'fs_written', 'hosttime'),
+                 nodes.rates(prev, 'fs_read', 'hosttime'))
+        net_tx, net_rx, fs_written, fs_read = rates
+        self.net_io_widget.set_data(net_tx, net_rx, names)
+        self.disk_io_widget.set_data(fs_written, fs_read, names)
+        self.t_hosts.set_text(str(len(nodes)))
         self.t_load.set_text('{0:.2f}/{1:.2f}/{2:.2f}'.format(
-            *[x / num for x in load]
+            nodes.mean('load1'), nodes.mean('load5'), nodes.mean('load15')
         ))
-        self.t_handler.set_text(', '.join([n.hostname for n in data]))
-
-    def _data_disks(self, data):
-        data_disks = [disk['dev'] for disk in data['data']]
-        for disk in data['disks']:
-            if disk['dev'] in data_disks:
-                yield disk
-
-    def calculate_disk_usage(self, data):
-        fs = [0, 0]
-        fs[0] += data['total']['used']
-        fs[1] += data['total']['size']
-        return fs
-
-    def calculate_disk_io(self, data):
-        io = dict(tx=0, rx=0)
-        io['tx'] += data['total']['bytes_written']
-        io['rx'] += data['total']['bytes_read']
-        return io
+        self.t_handler.set_text(', '.join(nodes.hostnames))
+        self.update_devices(DeviceSnapshot(data))
+        self.update_heap(nodes)
+        if self.groups is not None:
+            self.update_groups(nodes, rates)
+
+    def update_vitals(self, data):
+        if self.replaying is None:
+            self.accumulate_nodes(VitalsSnapshot(data), time.time())
+
+    def accumulate_nodes(self, nodes, timestamp):
+        """
+        Update the state that is accumulated from every refresh of the node
+        data, a ``NodeSnapshot`` or a ``VitalsSnapshot``: node events, the
+        heap tracker and the forecasts.
+        """
+        prev, self.vitals = self.vitals, nodes
+        self.add_events(node_events(prev, nodes, timestamp))
+        self.disk_forecast.update(nodes.ids, nodes.fs_used, nodes.hosttime)
+        self.heap_tracker.update(nodes)
+        self.heap_forecast.update(nodes.ids,
+                                  ratios(nodes.heap_used, nodes.heap_max),
+                                  nodes.heap_timestamp)
+
+    def accumulate_summary(self, summary):
+        self.cluster_forecast.update(('cluster',), (summary.fs_used,),
+                                     (summary.hosttime,))
+
+    def update_disk(self, nodes):
+        forecast = self.disk_forecast
+        used, size, names = nodes.fs_used, nodes.fs_size, nodes.names
+        etas = [forecast.eta(*node) for node in zip(nodes.ids, used, size)]
+        # nodes closest to full first, by time then by usage
+        order = sorted(range(len(nodes)), key=lambda idx: (
+            etas[idx] is None, etas[idx] or 0.0,
+            -(size[idx] > 0 and used[idx] / size[idx] or 0.0)))
+        self.disk_widget.set_data([used[idx] for idx in order],
+                                  [size[idx] for idx in order],
+                                  [names[idx] for idx in order])
+        self.disk_widget.set_forecast([(names[idx], etas[idx])
+                                       for idx in order
+                                       if etas[idx] is not None])
+
+    def summary_etas(self, summary):
+        """
+        The estimated time until the node closest to full and the whole
+        cluster are filled up, soonest first. The per node fits are fed on
+        every refresh, so the node is known without the per node rows.
+        """
+        etas = []
+        nodes = self.vitals
+        if nodes is not None:
+            soonest = None
+            for node_id, name, used, size in zip(nodes.ids, nodes.names,
+                                                 nodes.fs_used, nodes.fs_size):
+                eta = self.disk_forecast.eta(node_id, used, size)
+                if eta is not None and (soonest is None or eta < soonest[1]):
+                    soonest = (name, eta)
+            if soonest is not None:
+                etas.append(soonest)
+        eta = self.cluster_forecast.eta('cluster', summary.fs_used,
+                                        summary.fs_size)
+        if eta is not None:
+            etas.append(('cluster', eta))
+        return sorted(etas, key=lambda item: item[1])
+
+    def add_events(self, events):
+        if not events:
+            return
+        self.events.extend(events)
+        for event in events:
+            self.event_rows.append(urwid.Text([
+                ('default', datetime.fromtimestamp(event.timestamp).strftime(
+                    '%Y-%m-%d %H:%M:%S  ')),
+                (event.kind == RESTARTED and 'text_red' or 'text_yellow',
+                 '{0:<10}'.format(event.kind)),
+                ('default', event.node),
+            ]))
+        del self.event_rows[:-len(self.events)]
+        self.event_rows.set_focus(len(self.event_rows) - 1)
+
+    def update_groups(self, nodes, rates):
+        groups = self.groups
+        if groups.update(nodes) and groups.needs_attributes:
+            self.controller.on_view_change()
+        labels = groups.labels
+        size = [100.0 * len(members) for members in groups.members]
+        agg = groups.aggregate
+        self.cpu_widget.set_groups(agg(nodes.cpu_used), size, labels)
+        self.process_widget.set_groups(agg(nodes.process), size, labels)
+        self.memory_widget.set_groups(agg(nodes.mem_used),
+                                      agg(nodes.mem_total), labels)
+        self.heap_widget.set_groups(agg(nodes.heap_used),
+                                    agg(nodes.heap_max), labels)
+        self.disk_widget.set_groups(agg(nodes.fs_used),
+                                    agg(nodes.fs_size), labels)
+        net_tx, net_rx, fs_written, fs_read = rates
+        self.net_io_widget.set_groups(agg(net_tx), agg(net_rx), labels)
+        self.disk_io_widget.set_groups(agg(fs_written), agg(fs_read), labels)
+
+    def update_summary(self, data):
+        summary = ClusterSummary(data)
+        prev, self.summary = self.summary, summary
+        dist = summary.distributions
+        self.cpu_widget.set_summary(summary.cpu_used, 100.0 * summary.num,
+                                    dist.get('cpu'))
+        self.process_widget.set_summary(summary.process, 100.0 * summary.num,
+                                        dist.get('process'))
+        self.memory_widget.set_summary(summary.mem_used, summary.mem_total,
+                                       dist.get('mem'))
+        self.heap_widget.set_summary(summary.heap_used, summary.heap_max,
+                                     dist.get('heap'))
+        self.disk_widget.set_summary(summary.fs_used, summary.fs_size,
+                                     dist.get('disk'))
+        if self.replaying is None:
+            self.accumulate_summary(summary)
+        self.disk_widget.set_forecast(self.summary_etas(summary))
+        self.net_io_widget.set_summary(
+            summary.rate(prev, 'net_tx', 'net_timestamp'),
+            summary.rate(prev, 'net_rx', 'net_timestamp'))
+        self.disk_io_widget.set_summary(
+            summary.rate(prev, 'fs_written', 'hosttime'),
+            summary.rate(prev, 'fs_read', 'hosttime'))
+        self.t_hosts.set_text(str(summary.num))
+        self.t_load.set_text('{0:.2f}/{1:.2f}/{2:.2f}'.format(
+            summary.load1, summary.load5, summary.load15))
+
+    def plan(self, needs_nodes=False, needs_jobs=False):
+        """
+        Return which data is required to render the current view, plus the
+        node or job data that consumers outside of the view need.
+        """
+        tab = self.tab_holder.original_widget
+        return Plan(jobs=needs_jobs or tab is self.tab_4,
+                    nodes=needs_nodes or self.show_details or
+                    self.groups is not None or
+                    tab is self.tab_3 or tab is self.tab_5,
+                    attributes=self.groups is not None and
+                    self.groups.needs_attributes,
+                    tables=tab is self.tab_3)
+
+    def update_heap(self, nodes):
+        tracker = self.heap_tracker
+        used = ratios(nodes.heap_used, nodes.heap_max)
+        gc = [tracker.gc_rates(node_id) for node_id in nodes.ids]
+        self.jvm_widget.set_data(
+            nodes.names,
+            [tracker.history[node_id] for node_id in nodes.ids],
+            used,
+            [self.heap_forecast.trend(node_id) for node_id in nodes.ids],
+            [c for c, f in gc],
+            [f for c, f in gc])
+
+    def update_devices(self, devices):
+        prev, self.devices = self.devices, devices
+        self.device_widget.set_data(
+            devices.names,
+            devices.used,
+            devices.size,
+            devices.rates(prev, 'bytes_read', 'hosttime'),
+            devices.rates(prev, 'bytes_written', 'hosttime'),
+            devices.rates(prev, 'reads', 'hosttime'),
+            devices.rates(prev, 'writes', 'hosttime'))
+
+    def panels_visible(self):
+        return self.tab_holder.original_widget is self.tab_6
+
+    def update_panel(self, panel):
+        self.clear_failures([panel.query.name])
+        widget = self.panel_widgets[panel.query.name]
+        if panel.render == 'table':
+            widget.set_table(panel.columns, panel.rows)
+        elif panel.render == 'bar':
+            widget.set_bars(panel.labels, panel.values, panel.maximum)
+        else:
+            values = [v for v in panel.values if v is not None]
+            widget.set_history(panel.history,
+                              sum(values) if values else None)
+
+    def update_tables(self, data):
+        tables = TableSnapshot(data, self.replaying or time.time())
+        prev, self.tables = self.tables, tables
+        docs_rate = tables.rates(prev, 'docs', 'timestamp')
+        bytes_rate = tables.rates(prev, 'size', 'timestamp')
+        # busiest tables first, tables without a rate by size
+        order = sorted(range(len(tables)), key=lambda idx: (
+            docs_rate[idx] is None, -(docs_rate[idx] or 0.0),
+            -(bytes_rate[idx] or 0.0), -tables.size[idx]))
+        self.table_widget.set_data([tables.names[idx] for idx in order],
+                                   [tables.docs[idx] for idx in order],
+                                   [tables.size[idx] for idx in order],
+                                   [docs_rate[idx] for idx in order],
+                                   [bytes_rate[idx] for idx in order])
+
+    def update_checks(self, name, data):
+        checks = tuple((r.severity, r.description, getattr(r, 'nodes', None))
+                       for r in data)
+        # checks rarely change, so widgets are only touched if they did
+        if self.checks.get(name) == checks:
+            return
+        self.checks[name] = checks
+        failing = sorted((c for v in self.checks.values() for c in v),
+                         key=lambda c: -c[0])
+        self.checks_widget.set_data(failing)
+        if not failing:
+            self.t_checks.set_text(('bg_green', ' checks ok '))
+            return
+        worst = failing[0][0]
+        attr = worst >= 3 and 'bg_red' or worst == 2 and 'bg_yellow' or 'bg_green'
+        self.t_checks.set_text((attr, ' {0} failing check{1} '.format(
+            len(failing), len(failing) > 1 and 's' or '')))
 
     def update_settings(self, settings):
         self.set_logging_state(settings.stats_enabled)
@@ -377,7 +771,100 @@ class MainWindow(urwid.WidgetWrap):
         self.t_udc_enabled.set_text([self._state(settings.udc_enabled)])
         self.t_cluster_name.set_text([settings.name])
 
+    def freeze(self):
+        """
+        Pause the display on the latest frame. Results keep being collected
+        and are applied when the display is resumed.
+        """
+        if not len(self.history) or self.resuming is not None:
+            return
+        self.frozen = self.shown = self.history.seq
+        self.live = (self.nodes, self.devices, self.tables, self.summary)
+        self.update_status()
+
+    def resume(self):
+        """
+        Show the latest frame again. The accumulated state is first brought
+        up to date with the frames collected while paused, a few frames per
+        iteration of the event loop, so that a long pause does not block the
+        UI.
+        """
+        self.nodes, self.devices, self.tables, self.summary = self.live
+        self.resuming, self.frozen, self.shown, self.live = \
+            self.frozen, None, None, None
+        self.update_status()
+        self.replay()
+
+    def replay(self):
+        positions = self.history.since(self.resuming)
+        if len(positions) <= 1:
+            self.resuming = None
+            if positions:
+                self.show_frame(positions[-1])
+            elif len(self.history):
+                # nothing new since the pause, but a scrubbed frame may be
+                # displayed; accumulators already saw the latest frame
+                self.replaying = self.history.frames[-1][1]
+                try:
+                    self.show_frame(len(self.history) - 1)
+                finally:
+                    self.replaying = None
+            self.update_status()
+            return
+        for pos in positions[:-1][:self.REPLAY_STEP]:
+            seq, timestamp, state = self.history[pos]
+            if state.get('nodes'):
+                self.accumulate_nodes(NodeSnapshot(state['nodes']), timestamp)
+            if state.get('vitals'):
+                self.accumulate_nodes(VitalsSnapshot(state['vitals']),
+                                      timestamp)
+            if state.get('summary'):
+                self.accumulate_summary(ClusterSummary(state['summary'][0]))
+            self.resuming = seq
+        asyncio.get_event_loop().call_soon(self.replay)
+
+    def show_frame(self, position):
+        """
+        Apply the frame at ``position``, with rates calculated against the
+        preceding frame.
+        """
+        seq, timestamp, state = self.history[position]
+        prev = self.history.previous(position, 'nodes')
+        self.nodes = prev and NodeSnapshot(prev[1])
+        self.devices = prev and DeviceSnapshot(prev[1])
+        prev = self.history.previous(position, 'summary')
+        self.summary = prev and ClusterSummary(prev[1][0])
+        prev = self.history.previous(position, 'tables')
+        self.tables = prev and TableSnapshot(prev[1], prev[0])
+        self.apply(**state)
+
+    def scrub(self, step):
+        """
+        Show the frame ``step`` frames before or after the displayed one.
+        Rates are calculated against the preceding frame, and accumulators
+        such as the heap tracker and the forecasts are not updated.
+        """
+        # positions shift when frames are evicted while paused
+        current = self.history.position(self.shown)
+        position = max(0, min(len(self.history) - 1, current + step))
+        if position == current:
+            return
+        self.shown, self.replaying = self.history.frames[position][:2]
+        try:
+            self.show_frame(position)
+        finally:
+            self.replaying = None
+        self.update_status()
+
     def handle_input(self, key):
+        plan, panels = self.plan(), self.panels_visible()
+        self._handle_input(key)
+        if self.plan() != plan:
+            self.controller.on_view_change()
+        if self.panels_visible() != panels:
+            self.controller.on_panels_change()
+
+    def _handle_input(self, key):
         if self.menu1.can_handle_input(key):
             if key == '0':
                 if self.tab_header.original_widget is self.tab_1:
@@ -397,10 +884,27 @@ class MainWindow(urwid.WidgetWrap):
             elif key == '3':
                 self.set_active_tab(self.tab_4)
                 self.menu2.set_active(key)
+            elif key == '4':
+                self.set_active_tab(self.tab_5)
+                self.menu2.set_active(key)
+            elif key == '5':
+                self.set_active_tab(self.tab_6)
+                self.menu2.set_active(key)
         elif self.menu3.can_handle_input(key):
             self.menu3.set_inactive()
         else:
-            if key == 'x':
+            if key == 'p':
+                if self.frozen is None:
+                    self.freeze()
+                else:
+                    self.resume()
+            elif key in ('left', 'right') and self.frozen is not None:
+                self.scrub(key == 'left' and -1 or 1)
+            elif key == 'v' and \
+                    self.tab_holder.original_widget is self.tab_4:
+                self.next_jobs_pivot()
+            elif key == 'x':
+                self.show_details = not self.show_details
                 self.cpu_widget.toggle_details()
                 self.process_widget.toggle_details()
                 self.memory_widget.toggle_details()
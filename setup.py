@@ -53,6 +53,7 @@ setup(
     ],
     extras_require={
         'develop': ['pudb'],
+        'parquet': ['pyarrow'],
     },
     setup_requires=['setuptools_scm'],
     use_scm_version=True,
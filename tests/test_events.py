@@ -0,0 +1,174 @@
+# vi: set encoding=utf-8
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+
+import asyncio
+import unittest
+from collections import namedtuple
+from datetime import datetime, timezone
+from cstat.connector import (
+    DataProvider, VERSION_QUERY, NODE_VITALS_QUERY, QueryFailure)
+from cstat.events import JOINED, LEFT, RESTARTED
+from cstat.window import MainWindow
+
+Column = namedtuple('Column', ['name'])
+
+
+class FakeCluster:
+    """
+    Answers the version and the light per node query, all other queries
+    return empty results.
+    """
+
+    def __init__(self):
+        self.nodes = {'id1': 100, 'id2': 100}
+
+    def vitals(self):
+        ts = datetime.now(tz=timezone.utc)
+        heap = {'used': 10, 'max': 100, 'probe_timestamp': ts}
+        for node_id in self.nodes:
+            self.nodes[node_id] += 10
+        return [(node_id, 'node-' + node_id, ts, heap, 10, 100, [completed])
+                for node_id, completed in sorted(self.nodes.items())]
+
+    def result(self, stmt):
+        if stmt == VERSION_QUERY.stmt:
+            return ('version', ), [('4.0.0', )]
+        if stmt == NODE_VITALS_QUERY.stmt:
+            return ('id', 'name', 'hosttime', 'heap', 'fs_used', 'fs_size',
+                    'pool_completed'), self.vitals()
+        return (), []
+
+
+class FakeCursor:
+
+    def __init__(self, cluster):
+        self.cluster = cluster
+        self.description = None
+        self.rows = []
+        self.rowcount = -1
+
+    async def execute(self, stmt, params=None):
+        columns, self.rows = self.cluster.result(stmt)
+        self.description = [Column(name) for name in columns]
+        self.rowcount = len(self.rows)
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+
+class FakePool:
+
+    def __init__(self, cluster):
+        self.cluster = cluster
+
+    def acquire(self):
+        return self
+
+    def cursor(self):
+        return FakeCursor(self.cluster)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+
+class Controller:
+    """
+    Feeds results into the view like ``CrateStat`` and changes the fake
+    cluster after each refresh with ``steps``.
+    """
+
+    def __init__(self, cluster, steps, loop):
+        self.cluster = cluster
+        self.steps = list(steps)
+        self.loop = loop
+        self.view = None
+
+    def apply(self, result=None, failure=None):
+        if isinstance(failure, QueryFailure):
+            raise AssertionError(failure.error)
+        if result is None or 'vitals' not in result:
+            return
+        self.view.update(**result)
+        if not self.steps:
+            self.loop.stop()
+            return
+        self.steps.pop(0)(self.cluster.nodes)
+
+    def __getattr__(self, name):
+        # callbacks of the view which are not relevant here
+        return lambda *args, **kwargs: None
+
+
+class NodeEventsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        self.view.history.close()
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def run_steps(self, *steps):
+        cluster = FakeCluster()
+        controller = Controller(cluster, steps, self.loop)
+        self.view = controller.view = MainWindow(controller)
+        # nothing is shown that needs the per node query
+        self.assertFalse(self.view.plan().nodes)
+        DataProvider(FakePool(cluster), controller, interval=0,
+                     planner=self.view.plan)
+        self.loop.call_later(5.0, self.loop.stop)
+        self.loop.run_forever()
+        return [(e.kind, e.node) for e in self.view.events]
+
+    def test_membership_events_in_default_view(self):
+        events = self.run_steps(
+            lambda nodes: nodes.pop('id2'),
+            lambda nodes: nodes.update(id3=0),
+        )
+        self.assertEqual(events, [(LEFT, 'node-id2'), (JOINED, 'node-id3')])
+
+    def test_restart_in_default_view(self):
+        events = self.run_steps(
+            lambda nodes: nodes.update(id1=0),
+        )
+        self.assertEqual(events, [(RESTARTED, 'node-id1')])
+
+    def test_heap_history_in_default_view(self):
+        self.run_steps(lambda nodes: None, lambda nodes: None)
+        history = self.view.heap_tracker.history
+        self.assertEqual(sorted(history), ['id1', 'id2'])
+        self.assertEqual(len(history['id1']), 3)
+
+    def test_plan_jobs_for_consumers(self):
+        self.view = MainWindow(Controller(FakeCluster(), [], self.loop))
+        self.assertFalse(self.view.plan().jobs)
+        self.assertTrue(self.view.plan(needs_jobs=True).jobs)
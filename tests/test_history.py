@@ -0,0 +1,42 @@
+# vi: set encoding=utf-8
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+
+import unittest
+from collections import namedtuple
+from cstat.history import History
+
+Record = namedtuple('Record', ['value'])
+
+
+class HistoryTest(unittest.TestCase):
+
+    def test_frame_that_cannot_be_encoded_is_empty(self):
+        history = History()
+        history.append({'summary': [Record(object())]}, timestamp=1.0)
+        history.append({'summary': [Record(1)]}, timestamp=2.0)
+        # wait for the background thread to compress both frames
+        history.close()
+        history.collect()
+        self.assertEqual(history[0], (1, 1.0, {}))
+        self.assertEqual(history.previous(1, 'summary'), None)
+        seq, timestamp, state = history[1]
+        self.assertEqual(seq, 2)
+        self.assertEqual(state['summary'][0].value, 1)
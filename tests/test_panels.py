@@ -0,0 +1,85 @@
+# vi: set encoding=utf-8
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+
+import asyncio
+import unittest
+from collections import namedtuple
+from cstat.connector import QueryFailure
+from cstat.panels import Panel, PanelScheduler
+
+Record = namedtuple('Record', ['name', 'value'])
+
+
+class Consumer:
+
+    def __init__(self):
+        self.results = []
+        self.failures = []
+
+    def apply(self, result=None, failure=None):
+        if failure is not None:
+            self.failures.append(failure)
+        else:
+            self.results.append(result)
+
+
+class PanelSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def on_result(self, panel, rows):
+        consumer = Consumer()
+        scheduler = PanelScheduler([panel], None, consumer,
+                                   visible=lambda panel: True)
+        task = self.loop.create_future()
+        task.set_result({panel.query.name: rows})
+        scheduler.on_result(panel, task)
+        self.assertIsNotNone(panel.handle)
+        panel.handle.cancel()
+        return consumer
+
+    def test_bar_values(self):
+        panel = Panel('p', 'SELECT 1', render='bar', label='name')
+        consumer = self.on_result(panel, [Record('a', 1), Record('b', '2')])
+        self.assertEqual(consumer.results, [panel])
+        self.assertEqual(panel.labels, ['a', 'b'])
+        self.assertEqual(panel.values, [1.0, 2.0])
+
+    def test_missing_column_is_reported_and_rescheduled(self):
+        panel = Panel('p', 'SELECT 1', render='bar', value='missing')
+        consumer = self.on_result(panel, [Record('a', 1)])
+        self.assertEqual(consumer.results, [])
+        self.assertEqual(len(consumer.failures), 1)
+        self.assertIsInstance(consumer.failures[0], QueryFailure)
+        self.assertIsNone(panel.last_success)
+        self.assertEqual(panel.rows, [])
+
+    def test_value_that_is_not_a_number_is_reported(self):
+        panel = Panel('p', 'SELECT 1', render='bar', label='name')
+        consumer = self.on_result(panel, [Record('a', 'x')])
+        self.assertEqual(len(consumer.failures), 1)
+        self.assertIsNone(panel.last_success)
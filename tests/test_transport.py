@@ -0,0 +1,223 @@
+# vi: set encoding=utf-8
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+
+import json
+import asyncio
+import unittest
+from cstat.connector import DataProvider, VERSION_QUERY
+from cstat.transport import HttpPool, SQLError
+
+
+class StandInServer:
+    """
+    Minimal stand-in for the ``_sql`` endpoint of CrateDB. Responses are
+    sent with a content length, or chunked if ``chunked`` is set. If
+    ``drop_after`` is set, each connection is closed without a response once
+    that many requests were answered on it. ``results`` maps statements to
+    the ``(cols, rows)`` they return instead of the default result.
+    """
+
+    def __init__(self, chunked=False, drop_after=None, results=None):
+        self.chunked = chunked
+        self.drop_after = drop_after
+        self.results = results or {}
+        self.connections = 0
+        self.requests = []
+        self.handlers = []
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, '127.0.0.1', 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        for task in self.handlers:
+            task.cancel()
+        await asyncio.gather(*self.handlers, return_exceptions=True)
+        await self.server.wait_closed()
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        self.handlers.append(asyncio.current_task())
+        answered = 0
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line == b'\r\n':
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers['content-length']))
+                if self.drop_after is not None and answered >= self.drop_after:
+                    break
+                payload = json.loads(body.decode('utf-8'))
+                self.requests.append(payload)
+                writer.write(self.response(payload))
+                await writer.drain()
+                answered += 1
+        finally:
+            writer.close()
+
+    def response(self, payload):
+        if payload['stmt'].startswith('FAIL'):
+            status = '400 Bad Request'
+            result = {'error': {'message': 'SQLActionException[foo]',
+                                'code': 4000}}
+        else:
+            status = '200 OK'
+            cols, rows = self.results.get(
+                payload['stmt'], (['name', 'value'], [['a', 1], ['b', 2]]))
+            result = {'cols': cols, 'rows': rows, 'rowcount': len(rows)}
+        data = json.dumps(result).encode('utf-8')
+        head = ['HTTP/1.1 ' + status, 'Content-Type: application/json']
+        if self.chunked:
+            head.append('Transfer-Encoding: chunked')
+            body = b''.join(
+                '{0:x}\r\n'.format(len(part)).encode('ascii') + part + b'\r\n'
+                for part in (data[:10], data[10:])) + b'0\r\n\r\n'
+        else:
+            head.append('Content-Length: {0}'.format(len(data)))
+            body = data
+        return '\r\n'.join(head).encode('latin-1') + b'\r\n\r\n' + body
+
+
+class HttpPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def run_with(self, server, *statements):
+        async def run():
+            pool = HttpPool('127.0.0.1', await server.start())
+            results = []
+            try:
+                for stmt in statements:
+                    async with pool.acquire() as conn:
+                        async with conn.cursor() as cur:
+                            await cur.execute(stmt)
+                            results.append(
+                                ([c.name for c in cur.description], list(cur)))
+            finally:
+                pool.terminate()
+                await server.stop()
+            return results
+        return self.loop.run_until_complete(run())
+
+    def test_keep_alive_connection_is_reused(self):
+        server = StandInServer()
+        results = self.run_with(server, 'SELECT 1', 'SELECT 2', 'SELECT 3')
+        self.assertEqual(server.connections, 1)
+        self.assertEqual([r['stmt'] for r in server.requests],
+                         ['SELECT 1', 'SELECT 2', 'SELECT 3'])
+        self.assertEqual(results[0], (['name', 'value'], [['a', 1], ['b', 2]]))
+
+    def test_chunked_response(self):
+        server = StandInServer(chunked=True)
+        results = self.run_with(server, 'SELECT 1', 'SELECT 2')
+        self.assertEqual(results[1], (['name', 'value'], [['a', 1], ['b', 2]]))
+        self.assertEqual(server.connections, 1)
+
+    def test_error_response_raises(self):
+        server = StandInServer()
+        with self.assertRaisesRegex(SQLError, 'SQLActionException'):
+            self.run_with(server, 'FAIL')
+
+    def test_retry_after_idle_connection_was_closed(self):
+        server = StandInServer(drop_after=1)
+        results = self.run_with(server, 'SELECT 1', 'SELECT 2')
+        self.assertEqual(len(results), 2)
+        self.assertEqual(server.connections, 2)
+        self.assertEqual([r['stmt'] for r in server.requests],
+                         ['SELECT 1', 'SELECT 2'])
+
+    def test_params_use_question_mark_placeholders(self):
+        server = StandInServer()
+
+        async def run():
+            pool = HttpPool('127.0.0.1', await server.start())
+            try:
+                async with pool.acquire() as conn:
+                    async with conn.cursor() as cur:
+                        await cur.execute('SELECT %s', (1, ))
+                        await cur.execute("SELECT 'a%s'")
+            finally:
+                pool.terminate()
+                await server.stop()
+        self.loop.run_until_complete(run())
+        self.assertEqual(server.requests, [
+            {'stmt': 'SELECT ?', 'args': [1]},
+            {'stmt': "SELECT 'a%s'"},
+        ])
+
+
+class Consumer:
+
+    def __init__(self, refreshes, loop):
+        self.refreshes = refreshes
+        self.loop = loop
+        self.queries = 0
+
+    def apply(self, result=None, failure=None):
+        if result is None:
+            return
+        self.queries = max(self.queries, len(result))
+        self.refreshes -= 1
+        if self.refreshes == 0:
+            self.loop.stop()
+
+
+class DataProviderConnectionsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def test_concurrent_queries_reuse_connections(self):
+        server = StandInServer(results={
+            VERSION_QUERY.stmt: (['version'], [['4.0.0']]),
+        })
+        consumer = Consumer(5, self.loop)
+        pool = HttpPool('127.0.0.1',
+                        self.loop.run_until_complete(server.start()))
+        provider = DataProvider(pool, consumer, interval=0)
+        self.loop.call_later(5.0, self.loop.stop)
+        self.loop.run_forever()
+        provider.handle.cancel()
+        pool.terminate()
+        self.loop.run_until_complete(server.stop())
+        self.assertEqual(consumer.refreshes, 0)
+        # one connection per concurrent query of the first refresh, which
+        # are all reused by the following refreshes
+        self.assertEqual(server.connections, consumer.queries)
+        self.assertGreater(server.connections, 4)
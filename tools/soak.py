@@ -0,0 +1,397 @@
+# vi: set encoding=utf-8
+# Licensed to CRATE Technology GmbH ("Crate") under one or more contributor
+# license agreements.  See the NOTICE file distributed with this work for
+# additional information regarding copyright ownership.  Crate licenses
+# this file to you under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.  You may
+# obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# However, if you have executed another commercial license agreement
+# with Crate these terms will supersede the license and you may use the
+# software solely pursuant to the terms of the relevant commercial agreement.
+
+
+"""
+Soak test harness which drives ``DataProvider`` and ``MainWindow`` against a
+fake connection pool for a large number of refreshes and fails if memory
+grows beyond a bound. Run it from a checkout with cstat installed:
+
+    python tools/soak.py --ticks 1000000 --nodes 50
+
+The resident set size is sampled for the whole run. Allocations are only
+traced during the last ``--trace-ticks`` refreshes, since tracing slows down
+every refresh considerably, and the UI is rendered every ``--render-every``
+refreshes.
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import resource
+import tracemalloc
+from collections import namedtuple
+from datetime import datetime, timezone
+from cstat.connector import (
+    DataProvider,
+    VERSION_QUERY,
+    SETTINGS_QUERY,
+    JOBS_QUERY,
+    JOB_BUCKETS_QUERY,
+    ATTRIBUTES_QUERY,
+    TABLES_QUERY,
+    CHECKS_QUERY,
+    NODE_CHECKS_QUERY,
+    NODE_QUERY_V_2_3,
+    NODE_SUMMARY_QUERY_V_2_3,
+    NODE_VITALS_QUERY,
+)
+from cstat.snapshot import ClusterSummary
+
+Column = namedtuple('Column', ['name'])
+
+NODE_COLUMNS = (
+    'id', 'name', 'hostname', 'host', 'cpu_used', 'cpu_idle', 'hosttime',
+    'process', 'cpus', 'load', 'heap', 'mem', 'fs_total', 'fs_data_dev',
+    'disk_dev', 'disk_size', 'disk_used', 'disk_reads', 'disk_writes',
+    'disk_bytes_read', 'disk_bytes_written', 'net_timestamp', 'net_packets',
+    'pool_names', 'pool_rejected', 'pool_completed',
+)
+
+JOBS_COLUMNS = ('stmt', 'min', 'avg', 'max', 'median', 'perc95', 'perc99',
+                'count')
+
+VITALS_COLUMNS = ('id', 'name', 'hosttime', 'heap', 'fs_used', 'fs_size',
+                  'pool_completed')
+
+JOB_BUCKETS_COLUMNS = ('username', 'node', 'bucket', 'count', 'total', 'min',
+                       'max')
+
+
+def summary_columns():
+    return (('num', ) + ClusterSummary.METRICS + ('hosttime', 'net_timestamp') +
+            tuple(name + suffix for name in ClusterSummary.DISTRIBUTIONS
+                  for suffix in ('_lo', '_perc', '_hi')))
+
+
+class FakeCluster:
+    """
+    Generates results for the queries of ``DataProvider``. Counters grow
+    with every refresh and a node leaves and rejoins periodically.
+    """
+
+    def __init__(self, nodes):
+        self.nodes = nodes
+        self.tick = 0
+
+    def node(self, idx):
+        t = self.tick
+        ts = datetime.fromtimestamp(1500000000 + t, tz=timezone.utc)
+        return (
+            'id{0}'.format(idx), 'node{0:03d}'.format(idx),
+            'host{0}'.format(idx), 'host{0}:4200'.format(idx),
+            float((t + idx) % 100), 10.0, ts,
+            {'percent': float((t * 3 + idx) % 100)}, 8,
+            {'1': 1.0, '5': 0.5, '15': 0.2},
+            {'used': (t * 7919 + idx) % 1000, 'max': 1000, 'free': 0,
+             'probe_timestamp': ts},
+            {'used': 10, 'free': 20},
+            {'used': 5 + t % 50, 'size': 100, 'bytes_read': t * 100,
+             'bytes_written': t * 200},
+            ['/dev/sda'], ['/dev/sda'], [100], [5 + t % 50], [t], [t * 2],
+            [t * 100], [t * 200], ts, {'sent': t * 10, 'received': t * 20},
+            ['write', 'search'], [t // 100, 0], [t * 10 % 5000, t],
+        )
+
+    def members(self):
+        # every 100 refreshes the last node is missing for one refresh
+        count = self.nodes - (self.tick % 100 == 99 and 1 or 0)
+        return range(count)
+
+    def result(self, stmt):
+        if stmt == VERSION_QUERY.stmt:
+            return ('version', ), [('4.0.0', )]
+        if stmt == SETTINGS_QUERY.stmt:
+            return (('name', 'stats_enabled', 'enterprise_enabled',
+                     'udc_enabled'), [('soak', True, True, False)])
+        if stmt == JOBS_QUERY.stmt:
+            return JOBS_COLUMNS, [
+                (kind, 1.0, 5.0, 50.0, 4.0, 20.0, 40.0, self.tick % 1000)
+                for kind in ('SELECT', 'INSERT', 'UPDATE')
+            ]
+        if stmt == JOB_BUCKETS_QUERY.stmt:
+            return JOB_BUCKETS_COLUMNS, [
+                (user, 'node{0}'.format(idx), bucket,
+                 self.tick % 100 + 1, (self.tick % 100 + 1) * 2.0 ** (bucket / 4),
+                 1.0, 50.0)
+                for user in ('crate', 'app')
+                for idx in self.members()[:3]
+                for bucket in (4, 9, 17)
+            ]
+        if stmt == ATTRIBUTES_QUERY.stmt:
+            return ('id', 'attributes'), [
+                ('id{0}'.format(idx), {'zone': 'zone{0}'.format(idx % 3)})
+                for idx in self.members()
+            ]
+        if stmt == CHECKS_QUERY.stmt:
+            return ('id', 'severity', 'description'), [
+                (1, 3, 'The setting gateway.expected_nodes is not set')]
+        if stmt == NODE_CHECKS_QUERY.stmt:
+            return ('id', 'severity', 'description', 'nodes'), [
+                (6, 2, 'Low disk watermark exceeded', self.tick % 3)
+                for _ in range(self.tick % 2)]
+        if stmt == TABLES_QUERY.stmt:
+            return ('schema_name', 'table_name', 'partition_ident', 'docs',
+                    'size'), [
+                ('doc', 't{0}'.format(idx), idx % 2 and 'p{0}'.format(
+                    self.tick % 10) or None, self.tick * idx, self.tick * 100)
+                for idx in range(50)
+            ]
+        if stmt == NODE_QUERY_V_2_3.stmt:
+            self.tick += 1
+            return NODE_COLUMNS, [self.node(idx) for idx in self.members()]
+        if stmt == NODE_VITALS_QUERY.stmt:
+            return VITALS_COLUMNS, [
+                (node[0], node[1], node[6], node[10], node[12]['used'],
+                 node[12]['size'], node[-1])
+                for node in map(self.node, self.members())
+            ]
+        if stmt == NODE_SUMMARY_QUERY_V_2_3.stmt:
+            self.tick += 1
+            columns = summary_columns()
+            row = [1.0] * len(columns)
+            for idx, name in enumerate(columns):
+                if name.endswith('_perc'):
+                    row[idx] = [0.5, 0.9]
+            return columns, [tuple(row)]
+        raise ValueError('unexpected statement: {0}'.format(stmt))
+
+
+class FakeCursor:
+
+    def __init__(self, cluster):
+        self.cluster = cluster
+        self.description = None
+        self.rows = []
+        self.rowcount = -1
+
+    async def execute(self, stmt, params=None):
+        columns, self.rows = self.cluster.result(stmt)
+        self.description = [Column(name) for name in columns]
+        self.rowcount = len(self.rows)
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+
+class FakeConnection:
+
+    def __init__(self, cluster):
+        self.cluster = cluster
+
+    def cursor(self):
+        return FakeCursor(self.cluster)
+
+    def close(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+
+class FakePool:
+
+    def __init__(self, cluster):
+        self.cluster = cluster
+
+    def acquire(self):
+        return FakeConnection(self.cluster)
+
+    def terminate(self):
+        pass
+
+
+def rss():
+    """
+    Current resident set size in bytes, or the peak if the current size is
+    not available on this platform.
+    """
+    try:
+        with open('/proc/self/statm') as fp:
+            return int(fp.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class SoakController:
+    """
+    Stands in for ``CrateStat``: feeds every result into the UI and renders
+    it, and stops the event loop after the given number of refreshes.
+    """
+
+    def __init__(self, args, loop):
+        from cstat.window import MainWindow
+        from cstat.groups import GroupIndex
+        from cstat.rules import Rule, RuleEngine
+        self.args = args
+        self.loop = loop
+        groups = args.groups and GroupIndex(attribute='zone') or None
+        self.view = MainWindow(self, groups=groups,
+                               history_bytes=int(args.history_size * 2 ** 20))
+        self.view.handle_input('2')
+        self.rules = RuleEngine([Rule('heap', 'heap', '>', 90.0, duration=5.0)])
+        self.ticks = 0
+        self.samples = []
+        self.baseline = None
+        self.rss = None
+        self.rss_traced = None
+        self.provider = None
+
+    def plan(self):
+        return self.view.plan()
+
+    def on_view_change(self):
+        pass
+
+    def apply(self, result=None, failure=None):
+        if failure is not None:
+            raise RuntimeError(failure)
+        self.view.update(**result)
+        if result.get('nodes'):
+            self.rules.evaluate(self.view.nodes, now=float(self.ticks))
+            self.view.set_alerts(self.rules.alerts())
+        if result.get('nodes') or result.get('summary'):
+            self.tick()
+
+    def tick(self):
+        self.ticks += 1
+        if self.ticks % 1000 == 0:
+            # alternate between per node and summary refreshes, and switch
+            # between the tabs that show per node data
+            self.view.handle_input('x')
+            self.view.handle_input(str(self.ticks // 1000 % 4 + 1))
+        if self.ticks % 1000 == 500:
+            # pause, scrub back and forth, and resume a few ticks later
+            self.view.handle_input('p')
+            for key in ['left'] * 5 + ['right'] * 2:
+                self.view.handle_input(key)
+        if self.ticks % 1000 == 550:
+            self.view.handle_input('p')
+        if self.ticks % 100 == 0:
+            # pivot the job statistics, which is a no-op outside the jobs tab
+            self.view.handle_input('v')
+        if self.ticks % self.args.render_every == 0:
+            self.view.render((160, 80))
+        if self.ticks == self.args.warmup:
+            self.rss = rss()
+        # tracing starts one window before the baseline, so that objects
+        # which are replaced during the window were traced when allocated
+        if self.ticks == self.args.ticks - 2 * self.args.trace_ticks:
+            # tracing itself needs memory, so the rss is compared before
+            self.rss_traced = rss()
+            tracemalloc.start()
+        if self.ticks == self.args.ticks - self.args.trace_ticks:
+            self.baseline = tracemalloc.take_snapshot()
+        if self.ticks % self.args.sample_every == 0:
+            self.samples.append((self.ticks, rss()))
+            print('{0:>10} ticks  rss {1:>8.2f} MiB'.format(
+                self.ticks, self.samples[-1][1] / 2 ** 20))
+        if self.ticks >= self.args.ticks:
+            self.loop.stop()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser('soak', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--ticks', type=int, default=100000,
+                        help='number of refreshes to run')
+    parser.add_argument('--nodes', type=int, default=20,
+                        help='number of fake nodes')
+    parser.add_argument('--warmup', type=int, default=1000,
+                        help='refreshes before the baseline is taken')
+    parser.add_argument('--sample-every', type=int, default=10000,
+                        help='refreshes between memory samples')
+    parser.add_argument('--render-every', type=int, default=1000,
+                        help='refreshes between renderings of the UI')
+    parser.add_argument('--groups', action='store_true', default=False,
+                        help='group nodes by a fake zone attribute')
+    parser.add_argument('--history-size', type=float, default=1.0,
+                        help='size of the history buffer of the UI in MiB')
+    parser.add_argument('--trace-ticks', type=int, default=2000,
+                        help='number of final refreshes during which '
+                             'allocations are traced')
+    parser.add_argument('--max-growth', type=float, default=8.0,
+                        help='allowed growth of traced memory in MiB')
+    parser.add_argument('--max-rss-growth', type=float, default=32.0,
+                        help='allowed growth of the resident set size since '
+                             'warmup in MiB')
+    parser.add_argument('--top', type=int, default=10,
+                        help='number of allocation sites to report')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.trace_ticks <= 0 or \
+            args.warmup + 2 * args.trace_ticks > args.ticks:
+        print('--ticks must cover --warmup and twice --trace-ticks')
+        return 2
+    loop = asyncio.get_event_loop()
+    controller = SoakController(args, loop)
+    controller.provider = DataProvider(FakePool(FakeCluster(args.nodes)),
+                                       controller, interval=0,
+                                       planner=controller.plan)
+    started = time.time()
+    loop.run_forever()
+    elapsed = time.time() - started
+    final = tracemalloc.take_snapshot()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    ignore = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    stats = final.filter_traces(ignore).compare_to(
+        controller.baseline.filter_traces(ignore), 'lineno')
+    growth = sum(stat.size_diff for stat in stats) / 2 ** 20
+    rss_growth = (controller.rss_traced - controller.rss) / 2 ** 20
+    print('{0} ticks in {1:.1f}s ({2:.0f}/s)'.format(
+        controller.ticks, elapsed, controller.ticks / elapsed))
+    print('rss growth from tick {0} to {1}: {2:.2f} MiB'.format(
+        args.warmup, args.ticks - 2 * args.trace_ticks, rss_growth))
+    print('traced memory growth in the last {0} ticks: {1:.2f} MiB '
+          '(peak {2:.2f} MiB)'.format(
+              args.trace_ticks, growth, peak / 2 ** 20))
+    print('top allocation sites:')
+    for stat in stats[:args.top]:
+        print('  {0}'.format(stat))
+    if growth > args.max_growth:
+        print('FAILED: traced memory grew more than {0:.2f} MiB'.format(
+            args.max_growth))
+        return 1
+    if rss_growth > args.max_rss_growth:
+        print('FAILED: rss grew more than {0:.2f} MiB'.format(
+            args.max_rss_growth))
+        return 1
+    print('OK')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())